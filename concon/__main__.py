@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 from datetime import datetime
+import os
 import sys
 
 import torch
@@ -21,6 +22,15 @@ def train(args):
         print((f"Directory '{args.data_set}' not found."), flush=True)
         sys.exit()
 
+    if(args.distributed): # One process per GPU, launched with torchrun; each rank samples its own batches (batches are drawn i.i.d., so no explicit sharding of the dataset is needed)
+        torch.distributed.init_process_group('nccl' if(args.device.type == 'cuda') else 'gloo')
+        if(args.device.type == 'cuda'):
+            args.device = torch.device('cuda', int(os.environ.get('LOCAL_RANK', torch.distributed.get_rank())))
+            torch.cuda.set_device(args.device)
+        if(torch.distributed.get_rank() != 0): # Only rank 0 writes summaries and checkpoints
+            args.no_summary = True
+            args.save_every = 0
+
     summary_dir = path_replace(args.summary, '[now]', datetime.now().strftime('%Y-%m-%d_%H-%M-%S'))
     models_dir = path_replace(args.models, '[summary]', summary_dir)
 
@@ -43,6 +53,7 @@ def train(args):
         elif(args.population is not None): model = AliceBobPopulation(args, autologger, data_loader, message_dump_dir)
         else: model = AliceBob(args, autologger, data_loader, message_dump_dir)
         model = model.to(args.device)
+        if(args.distributed): model.wrap_distributed(args) # Must happen after the agents have been moved to their device
 
         if(args.detect_anomaly):
             torch.autograd.set_detect_anomaly(True)
@@ -28,7 +28,7 @@ class Receiver(Agent):
         self.has_shared_param = has_shared_param
 
     def encode_message(self, message, length):
-        return self.message_encoder(message, length).unsqueeze(-1)
+        return self.message_encoder(message, length) # Shape: (batch size, hidden size)
 
     # images: tensor of shape (batch size, nb img, *IMG_SHAPE)
     # message: 
@@ -41,7 +41,7 @@ class Receiver(Agent):
     # images: tensor of shape (batch size, nb img, *IMG_SHAPE)
     # encoded_messages: tensor of shape (batch size, hidden size)
     # use_spigot: boolean that indicates whether to use a GradSpigot (after the encoding of the message)
-    def aux_forward(self, images, encoded_message, use_spigot):
+    def aux_forward(self, images, encoded_message, use_spigot=False):
         """
             Forward propagation.
             Input:
@@ -50,8 +50,8 @@ class Receiver(Agent):
                 `Outcome` containing action taken, entropy, log prob, dist and scores.
         """
 
-        # Encodes the images.
-        encoded_images = self.image_encoder(images.view(-1, *images.shape[2:])) # Shape: ((batch size * nb img), hidden size)
+        # Encodes the images. (`reshape` instead of `view`, so that non-contiguous inputs go through without an explicit copy on our side)
+        encoded_images = self.image_encoder(images.reshape(-1, *images.shape[2:])) # Shape: ((batch size * nb img), hidden size)
         encoded_images = encoded_images.view(images.shape[0], images.shape[1], -1) # Shape: (batch size, nb img, hidden size)
 
         if(use_spigot):
@@ -60,8 +60,8 @@ class Receiver(Agent):
         else:
             msg_spigot = None
 
-        # Scores the targets.
-        scores = torch.bmm(encoded_images, encoded_message).squeeze(-1) # Shape: (batch size, nb img)
+        # Scores the targets. (One fused contraction instead of unsqueeze+bmm+squeeze.)
+        scores = torch.einsum('bkd,bd->bk', encoded_images, encoded_message) # Shape: (batch size, nb img)
 
         outcome = Outcome(scores=scores, msg_spigot=msg_spigot)
 
@@ -87,6 +87,6 @@ class Receiver(Agent):
         has_shared_param = (image_encoder is not None) or (symbol_embeddings is not None)
         
         if(image_encoder is None): image_encoder = build_cnn_encoder_from_args(args)
-        message_encoder = MessageEncoder.from_args(args, symbol_embeddings=symbol_embeddings)
-        
+        message_encoder = torch.jit.script(MessageEncoder.from_args(args, symbol_embeddings=symbol_embeddings)) # Scripted independently from the decoder, so each side gets optimized for its own (static) shapes; the wrapper shares the underlying parameters (including the possibly shared embeddings)
+
         return cls(image_encoder, message_encoder, args, has_shared_param)
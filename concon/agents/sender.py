@@ -59,6 +59,6 @@ class Sender(Agent):
         has_shared_param = (image_encoder is not None) or (symbol_embeddings is not None)
         
         if(image_encoder is None): image_encoder = build_cnn_encoder_from_args(args)
-        message_decoder = MessageDecoder.from_args(args, symbol_embeddings=symbol_embeddings)
-        
+        message_decoder = torch.jit.script(MessageDecoder.from_args(args, symbol_embeddings=symbol_embeddings)) # The autoregressive decode loop is latency-bound, so it runs inside the TorchScript interpreter; the wrapper shares the underlying parameters (including the possibly shared embeddings)
+
         return cls(image_encoder, message_decoder, args, has_shared_param)
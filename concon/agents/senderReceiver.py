@@ -12,7 +12,8 @@ class SenderReceiver(Agent):
 
         if(check_shared_params):
             assert sender.image_encoder is receiver.image_encoder, 'parameters are not shared'
-            assert receiver.message_encoder.symbol_embeddings is sender.message_decoder.symbol_embeddings, 'parameters are not shared'
+            # The message modules are TorchScript-wrapped by the agent factories, and a script wrapper returns fresh accessor objects for its submodules (so an `is` check between them always fails); the underlying storage is shared, hence the comparison of the embedding weights themselves
+            assert receiver.message_encoder.symbol_embeddings.weight.data_ptr() == sender.message_decoder.symbol_embeddings.weight.data_ptr(), 'parameters are not shared'
 
         self.sender = sender
         self.receiver = receiver
@@ -11,6 +11,27 @@ from collections import defaultdict
 
 from ..utils import misc
 
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int32) # Number of set bits in each possible byte; used to take population counts of bit-packed arrays
+
+try: # Numba is optional; when available, the masked population count (the hot spot of the rule mining) is compiled to a parallel native kernel, avoiding the temporaries of the table-lookup version
+    import numba
+
+    @numba.njit(parallel=True, cache=True)
+    def _masked_popcount(packed_fv, packed_gold): # `packed_fv` has shape (nb bytes, nb features); `packed_gold` has shape (nb bytes,)
+        tp = np.zeros(packed_fv.shape[1], dtype=np.int32)
+        for j in numba.prange(packed_fv.shape[1]):
+            acc = 0
+            for i in range(packed_fv.shape[0]):
+                v = (packed_fv[i, j] & packed_gold[i])
+                v = (v - ((v >> 1) & 0x55)) # Byte-wise SWAR population count
+                v = ((v & 0x33) + ((v >> 2) & 0x33))
+                acc += ((v + (v >> 4)) & 0x0F)
+            tp[j] = acc
+        return tp
+except ImportError:
+    def _masked_popcount(packed_fv, packed_gold):
+        return _POPCOUNT[(packed_fv & packed_gold[:, None])].sum(axis=0)
+
 # `data` should either be a pair (dataset, messages) or None. If None, then messages will be generated
 # Except for generating the messages,
 #   we need model for _.base_alphabet_size
@@ -29,14 +50,16 @@ def decision_tree_standalone(model, data_iterator):
     categories = []
     print("Generating the messages…")
     batch_numbers = range(nb_batch)
-    with torch.no_grad():
+    with torch.inference_mode(): # Stronger than no_grad: also skips version-counter and view bookkeeping
         for _ in batch_numbers:
             model.start_episode(train_episode=False) # Selects agents at random if necessary
 
             batch = data_iterator.get_batch(batch_size, data_type='test', no_evaluation=False, sampling_strategies=['different'], keep_category=True) # Standard evaluation batch
-            sender_outcome, receiver_outcome = model(batch)
+            sender_outcome = model.sender(batch.original_img(stack=True)) # Only the sender is run, as the messages are all we need here
 
-            messages.extend([msg.tolist()[:l] for msg, l in zip(*sender_outcome.action)])
+            msgs = sender_outcome.action[0].tolist() # A single host-device round-trip for the whole batch
+            lens = sender_outcome.action[1].view(-1).tolist()
+            messages.extend([msg[:l] for msg, l in zip(msgs, lens)])
             categories.extend([x.category for x in batch.original])
     
     categories = np.array(categories) # Numpyfies the categories (but not the messages, as there are list of various length)
@@ -196,45 +219,69 @@ class SeqTerm():
     def __hash__(self):
         return hash(self.t)
 
+# Decodes a base-`base` integer code of known size `k` back into the corresponding n-gram (SeqTerm)
+def code_to_ngram(code, k, base):
+    digits = []
+    for _ in range(k):
+        digits.append(int(code % base))
+        code //= base
+
+    return SeqTerm(tuple(reversed(digits)))
+
 # The messages must be iterables of integers between 0 (included) and `alphabet_size` (excluded)
 # `gram_size` is the k max of k-grams to consider
 # `concepts` is a list of dictionaries {value name -> value idx}
 def analyse(messages, categories, alphabet_size, concepts, gram_size, disj_size=1, feature_vectors=None, full_max_depth=128, conceptual_max_depth=64):
     result = {}
 
-    # Returns all the k-grams for 0 < k <= `max_length` in the message with an out-of-message symbol at the beginning and the end
-    def get_ngrams(message, max_length):
-        assert (max_length > 0)
-        for s in message: yield SeqTerm((s,)) # I separate unigrams so that we don't return the unigram composed of the out-of-message symbol
-
-        message_tmp = [alphabet_size] + list(message) + [alphabet_size] # I add an out-of-message symbol at the beginning and at the end # TODO May I could use -1
-        for k in range(2, (min(max_length, len(message_tmp)) + 1)): # Length of the n-gram
-            for i in range(len(message_tmp) - k + 1):
-                yield SeqTerm(tuple(message_tmp[i:(i + k)]))
-
-    # Can be used to have disjunctions directly in the n-grams, but we will not do that
-    def get_disj_ngrams(message, max_length):
-        if(disj_size == 1):
-            for ngram in get_ngrams(message, max_length): yield ngram
-        else:
-            for ngram in get_ngrams(message, max_length):
-                for disj in apply_disj(ngram, disj_size, (alphabet_size + 1)): yield disj
-
     if(feature_vectors is None):
-        # Determines the set of n-grams
-        ngrams_idx = defaultdict(itertools.count().__next__) # From ngrams (tuples) to indices
-        for message in messages:
-            for ngram in get_ngrams(message, gram_size):
-                _ = ngrams_idx[ngram]
-        ngrams = np.array(sorted(ngrams_idx.keys(), key=len)) # From indices to ngrams (SeqTerm)
+        assert (gram_size > 0)
+
+        # Identical messages share their features, so the extraction below runs over unique messages only and the resulting vectors are scattered back afterwards
+        uniq_idx = {} # From message (as a tuple) to unique-message index
+        inverse = np.array([uniq_idx.setdefault(tuple(message), len(uniq_idx)) for message in messages])
+        uniq_messages = list(uniq_idx)
+
+        # Vectorised n-gram extraction: the messages are padded into a single integer matrix and each n-gram is mapped to an integer code using base-(alphabet_size + 1) arithmetic, so that the whole feature matrix is built with a few NumPy operations instead of a Python loop over every n-gram of every message
+        boundary = alphabet_size # The out-of-message symbol added at the beginning and at the end # TODO May I could use -1
+        base = (alphabet_size + 1)
+
+        lengths = np.array([len(message) for message in uniq_messages], dtype=np.int32)
+        max_length = int(lengths.max()) if(len(uniq_messages) > 0) else 0
+        padded = np.full((len(uniq_messages), (max_length + 2)), -1, dtype=np.int64) # -1 marks the positions after the end of the message
+        padded[:, 0] = boundary
+        for i, message in enumerate(uniq_messages):
+            padded[i, 1:(1 + lengths[i])] = message
+            padded[i, (1 + lengths[i])] = boundary
+
+        codes_by_k = {} # From n-gram size to a pair (array of n-gram codes, array of corresponding row indices)
+        for k in range(1, (min(gram_size, (max_length + 2)) + 1)):
+            if(k == 1): # I separate unigrams so that we don't get the unigram composed of the out-of-message symbol
+                rows, cols = np.nonzero((padded >= 0) & (padded != boundary))
+                codes_by_k[k] = (padded[rows, cols], rows)
+            else:
+                windows = np.lib.stride_tricks.sliding_window_view(padded, k, axis=1) # Shape: (nb messages, nb positions, k)
+                valid = (windows >= 0).all(axis=-1)
+                codes = np.zeros(windows.shape[:2], dtype=np.int64)
+                for j in range(k): codes = ((codes * base) + windows[..., j])
+                codes_by_k[k] = (codes[valid], np.nonzero(valid)[0])
+
+        # Builds the set of n-grams (sorted by size), decoding each observed code back into the corresponding tuple of symbols
+        ngram_list = []
+        columns_by_k = {} # From n-gram size to a pair (array of unique codes, index of the first corresponding column)
+        for k in sorted(codes_by_k):
+            uniq_codes = np.unique(codes_by_k[k][0])
+            columns_by_k[k] = (uniq_codes, len(ngram_list))
+            ngram_list.extend([code_to_ngram(code, k, base) for code in uniq_codes])
+        ngrams = np.empty(len(ngram_list), dtype=object) # From indices to ngrams (SeqTerm)
+        ngrams[:] = ngram_list
         ngrams_idx = {ngram: i for (i, ngram) in enumerate(ngrams)}
 
-        # Generates the (n-gram) feature vectors
-        ngram_vectors = np.zeros((len(messages), len(ngrams)), dtype=np.int32)
-        for i, message in enumerate(messages):
-            for ngram in get_ngrams(message, gram_size):
-                idx = ngrams_idx[ngram]
-                ngram_vectors[i, idx] += 1
+        # Generates the (n-gram) feature vectors by scattering the n-gram counts of all messages at once
+        ngram_vectors = np.zeros((len(uniq_messages), len(ngrams)), dtype=np.uint8) # The counts are bounded by the message length (and the disjunction sums by a few of those), so one byte per cell is plenty; sklearn densifies to float anyway, so compact dense is the sweet spot
+        for k, (codes, rows) in codes_by_k.items():
+            uniq_codes, first_column = columns_by_k[k]
+            np.add.at(ngram_vectors, (rows, (first_column + np.searchsorted(uniq_codes, codes))), 1)
 
         if(disj_size == 1):
             features = ngrams
@@ -254,13 +301,15 @@ def analyse(messages, categories, alphabet_size, concepts, gram_size, disj_size=
             features_idx = {ngram: i for (i, ngram) in enumerate(features)}
 
             # Feature vectors
-            feature_vectors = np.zeros((len(messages), len(features)), dtype=np.int32)
+            feature_vectors = np.zeros((len(uniq_messages), len(features)), dtype=np.uint8)
             feature_vectors[:, :len(ngrams)] = ngram_vectors
             for i in range(len(ngrams), len(features)): # For all disjunctive terms (by index)
                 disjunction = features[i]
                 for ngram in disjunction.seq_terms:
                     feature_vectors[:, i] += feature_vectors[:, features_idx[ngram]]
 
+        feature_vectors = feature_vectors[inverse] # Back to one row per message
+
         result['features'] = features
         result['features_idx'] = features_idx
 
@@ -270,8 +319,12 @@ def analyse(messages, categories, alphabet_size, concepts, gram_size, disj_size=
     def category_to_name(category):
         return '_'.join([str(v) for v in category])
 
-    X = feature_vectors # We might want to use only some of these (e.g., only the unigrams)
-    Y = np.array([category_to_name(category) for category in categories]) 
+    X = feature_vectors # We might want to use only some of these (e.g., only the unigrams); shared by all the trees below, so sklearn's input validation is the only per-fit copy
+    cats = np.asarray(categories) # Shape: (nb messages, nb concepts)
+
+    # The naming function runs once per distinct category instead of once per message
+    uniq_cats, cat_inverse = np.unique(cats, axis=0, return_inverse=True)
+    Y = np.array([category_to_name(category) for category in uniq_cats])[cat_inverse]
 
     classifier = sklearn.tree.DecisionTreeClassifier(max_depth=full_max_depth).fit(X, Y)
     accuracy = classifier.score(X, Y) # Accuracy on the 'training set'
@@ -283,11 +336,7 @@ def analyse(messages, categories, alphabet_size, concepts, gram_size, disj_size=
     for dim in range(len(concepts)):
         if(len(concepts[dim]) < 2): continue
 
-        def category_to_name(category):
-            return str(category[dim])
-
-        X = feature_vectors # We might want to use only some of these (e.g., only the unigrams)
-        Y = np.array([category_to_name(category) for category in categories]) 
+        Y = cats[:, dim].astype(str) # Same labels as mapping str() over the column, without the per-message Python call
 
         classifier = sklearn.tree.DecisionTreeClassifier(max_depth=conceptual_max_depth).fit(X, Y)
         accuracy = classifier.score(X, Y) # Accuracy on the 'training set'
@@ -353,6 +402,14 @@ def decision_tree(messages, categories, alphabet_size, concepts, gram_size=1, di
     rule_frequence_threshold = 0.05
     rules = defaultdict(list) # From LSH (feature or ('NOT', feature)) to list of RHS·s, which are sets of properties (we also indicate the precision of the rule)
 
+    cat_mat = np.asarray(categories) # Shape: (nb messages, nb concepts); used to compute the `gold` vectors without a Python loop over the categories
+
+    # These depend only on the features, not on the conjunction under consideration, so they are computed once and for all
+    # The feature matrix is bit-packed along the sample axis (8 messages per byte), so that true-positive counts reduce to a bitwise AND followed by a population count - an 8th of the memory traffic of integer arithmetic
+    packed_feature_vectors = np.packbits(boolean_feature_vectors, axis=0) # Shape: (ceil(nb messages / 8), nb features)
+    pos_counts = _POPCOUNT[packed_feature_vectors].sum(axis=0) # Per-feature number of messages containing the feature
+    N = boolean_feature_vectors.shape[0]
+
     max_depth = 2 # None # We could successively try with increasing depth
     max_conjunctions = 3 # len(concepts)
     for size_conjunctions in range(1, (max_conjunctions + 1)):
@@ -362,63 +419,52 @@ def decision_tree(messages, categories, alphabet_size, concepts, gram_size=1, di
         for concept_indices in itertools.combinations(range(len(concepts)), size_conjunctions): # Iterates over all subsets of [|0, `len(concepts)`|[ of size `size_conjunctions`
             #print([data_iterator.concept_names[idx] for idx in concept_indices])
 
+            sub_cats = cat_mat[:, list(concept_indices)] # Depends only on the selected concepts, so the column slice is taken once and reused for every value conjunction
+
             # For each selected concept, we pick a value
             conjunctions = itertools.product(*[concepts[idx].keys() for idx in concept_indices])
 
             for conjunction in conjunctions:
                 #print('\t class: %s' % str(conjunction))
 
-                def in_class(category):
-                    for i, idx in enumerate(concept_indices):
-                        if(category[idx] != concepts[idx][conjunction[i]]): return False
-
-                    return True
-
-                #in_class_aux = np.vectorize(lambda datapoint: in_class(datapoint.category))
-
                 # For each n-gram, check if it is a good predictor of the class (equivalent to building a decision tree of depth 1)
-                #gold = in_class_aux(dataset)
-                gold = np.array([in_class(category) for category in categories])
-                for feature_idx, feature in enumerate(features):
-
-                    ratio = gold.mean()
-                    baseline_accuracy = max(ratio, (1.0 - ratio)) # Precision of the majority class baseline
-
-                    feature_type = 'presence'
-                    prediction = boolean_feature_vectors[:, feature_idx]
-
-                    matches = (gold == prediction)
-
-                    accuracy = matches.mean()
-                    error_reduction = (1 - baseline_accuracy) / (1 - accuracy)
-
-                    precision = gold[prediction].mean() # 1 means that the symbol entails the property
-                    if((precision > rule_precision_threshold) and (prediction.sum() > rule_frequence_threshold * prediction.size)):
-                        rules[('', feature)].append((set(conjunction), precision))
-                        #print('%s means %s (%f)' % (feature, conjunction, precision))
-                    recall = prediction[gold].mean() # 1 means that the property entails the symbol
-                    f1 = (2 * precision * recall / (precision + recall)) if(precision + recall > 0.0) else 0.0
-
-                    item = (accuracy, baseline_accuracy, error_reduction, precision, recall, f1, conjunction, str(feature), feature_type)
-                    results_binary_classifier.append(item)
-
-                    feature_type = 'absence'
-                    prediction = (prediction ^ True)
-
-                    matches = (gold == prediction)
+                target = np.array([concepts[idx][conjunction[i]] for i, idx in enumerate(concept_indices)]) # The values that the selected concepts must take
+                gold = (sub_cats == target).all(axis=1)
+
+                gold_sum = int(gold.sum())
+                if((gold_sum < 2) or (gold_sum > (N - 2))): continue # (Near-)trivial classes carry no signal; skips the whole feature sweep
+
+                ratio = (gold_sum / N)
+                baseline_accuracy = max(ratio, (1.0 - ratio)) # Precision of the majority class baseline
+
+                # The statistics of all features are computed at once: a bitwise AND with the packed gold vector followed by a population count gives the per-feature true-positive counts, from which precision/recall/F1 for both the presence and the absence of each feature derive algebraically
+                packed_gold = np.packbits(gold) # Same bit layout as `packed_feature_vectors`
+                tp = _masked_popcount(packed_feature_vectors, packed_gold) # Per-feature number of messages of the class containing the feature
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    accuracy = ((((2 * tp) + N) - pos_counts - gold_sum) / N) # I.e., (gold == prediction).mean() for each feature
+                    error_reduction = ((1 - baseline_accuracy) / (1 - accuracy))
+                    precision = (tp / pos_counts) # 1 means that the symbol entails the property
+                    recall = (tp / gold_sum) # 1 means that the property entails the symbol
+                    f1 = np.where(((precision + recall) > 0.0), ((2 * precision * recall) / (precision + recall)), 0.0)
+
+                    # Same thing for the absence of each feature; there is no need to materialise the negated feature matrix
+                    accuracy_abs = (1.0 - accuracy)
+                    error_reduction_abs = ((1 - baseline_accuracy) / (1 - accuracy_abs))
+                    precision_abs = ((gold_sum - tp) / (N - pos_counts)) # 1 means that the absence of the symbol entails the property
+                    recall_abs = ((gold_sum - tp) / gold_sum) # 1 means that the property entails the absence of the symbol
+                    f1_abs = np.where(((precision_abs + recall_abs) > 0.0), ((2 * precision_abs * recall_abs) / (precision_abs + recall_abs)), 0.0)
+
+                for feature_idx in np.nonzero((precision > rule_precision_threshold) & (pos_counts > (rule_frequence_threshold * N)))[0]:
+                    rules[('', features[feature_idx])].append((set(conjunction), precision[feature_idx]))
+                    #print('%s means %s (%f)' % (features[feature_idx], conjunction, precision[feature_idx]))
+                for feature_idx in np.nonzero((precision_abs > rule_precision_threshold) & ((N - pos_counts) < ((1 - rule_frequence_threshold) * N)))[0]:
+                    rules[('NOT', features[feature_idx])].append((set(conjunction), precision_abs[feature_idx]))
+                    #print('NOT %s means %s (%f)' % (features[feature_idx], conjunction, precision_abs[feature_idx]))
 
-                    accuracy = matches.mean()
-                    error_reduction = (1 - baseline_accuracy) / (1 - accuracy)
-
-                    precision = gold[prediction].mean() # 1 means that the absence of the symbol entails the property
-                    if((precision > rule_precision_threshold) and (prediction.sum() < (1 - rule_frequence_threshold) * prediction.size)):
-                        rules[('NOT', feature)].append((set(conjunction), precision))
-                        #print('NOT %s means %s (%f)' % (feature, conjunction, precision))
-                    recall = prediction[gold].mean() # 1 means that the property entails the absence of the symbol
-                    f1 = (2 * precision * recall / (precision + recall)) if(precision + recall > 0.0) else 0.0
-
-                    item = (accuracy, baseline_accuracy, error_reduction, precision, recall, f1, conjunction, str(feature), feature_type)
-                    results_binary_classifier.append(item)
+                for feature_idx, feature in enumerate(features):
+                    str_feature = str(feature)
+                    results_binary_classifier.append((accuracy[feature_idx], baseline_accuracy, error_reduction[feature_idx], precision[feature_idx], recall[feature_idx], f1[feature_idx], conjunction, str_feature, 'presence'))
+                    results_binary_classifier.append((accuracy_abs[feature_idx], baseline_accuracy, error_reduction_abs[feature_idx], precision_abs[feature_idx], recall_abs[feature_idx], f1_abs[feature_idx], conjunction, str_feature, 'absence'))
 
         print("\nBest binary classifiers")
         print("\tby error reduction")
@@ -470,20 +516,18 @@ def decision_tree(messages, categories, alphabet_size, concepts, gram_size=1, di
         else: # Negative rules
             return f2.entails(f1)
 
+    by_rhs = defaultdict(list) # From RHS (as a frozenset) to the list of LHS·s it is predicted by; only rules sharing the very same RHS can make one another redundant, so this index prunes almost all pairs
+    for lhs, rhs in clean_rules:
+        by_rhs[frozenset(rhs)].append(lhs)
+
     for lhs1, rhs1 in clean_rules:
         ok = True
-        
-        for lhs2, rhs2 in clean_rules:
-            if((rhs1 == rhs2) and (lhs1 != lhs2)):
-                if(entails(lhs1, lhs2)):
-                    ok = False
-                    break
-
-            if((lhs1 == lhs2) and (rhs1 != rhs2)):
-                if(entails(rhs2, lhs1)):
-                    ok = False
-                    break
-        
+
+        for lhs2 in by_rhs[frozenset(rhs1)]:
+            if((lhs1 != lhs2) and entails(lhs1, lhs2)):
+                ok = False
+                break
+
         # TODO Checks whether the rule can be obtained compositionaly from other rules (many situations are possible)
         t, f = lhs1
         if(t != 'NOT'):
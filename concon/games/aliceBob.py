@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 import scipy
 import itertools as it
@@ -19,6 +20,32 @@ from ..eval import decision_tree
 
 from .game import Game
 
+# Penalties applied to the dream images of `test_visualize`: a chain of tiny pointwise ops and reductions executed a thousand times per call.
+# Scripting it removes the per-op Python dispatch and lets the fuser merge the elementwise parts; the L1 norms are written as `.abs().sum()`, which is the same thing and scripts cleanly.
+@torch.jit.script
+def _dream_penalties(dream, filter_weight):
+    regularisation_loss = (0.01 * (dream - 0.5).abs().sum()) # Similar to L1 regularisation but centered around 0.5
+    smoothness_loss = (20.0 * torch.conv2d(dream.squeeze(1), filter_weight, groups=3).abs().sum()) # The filter is a Laplacian checking smoothness
+    return (regularisation_loss + smoothness_loss)
+
+# The fixed 3x3 Laplacian used by `test_visualize` to penalise non-smooth dream images; -12.8 (at the center) is equal to the opposite of the sum of the other coefficients.
+# Built once at import time with shape [channels, 1, 3, 3] (one depthwise group per colour channel) and applied functionally inside `_dream_penalties`.
+_LAPLACIAN = torch.tensor([[1.2, 2, 1.2], [2, -12.8, 2], [1.2, 2, 1.2]]).view(1, 1, 3, 3).repeat(3, 1, 1, 1)
+_laplacian_by_device = {} # The filter copied to each device it has been requested on, so repeated visualisations pay the transfer only once
+def _laplacian_for(device):
+    filter_weight = _laplacian_by_device.get(device)
+    if(filter_weight is None): filter_weight = _laplacian_by_device.setdefault(device, _LAPLACIAN.to(device))
+    return filter_weight
+
+# The pointwise part of the sender's reward: the base reward, a -1 anytime the message length limit is reached, and the length penalty (equal to 0 when `penalty` is 0, increasing to 1 with the length of the message otherwise).
+# Scripted so that the chain of tiny elementwise ops is fused instead of being dispatched one by one from Python every step; the scalar arguments need the type annotations for TorchScript, which specializes on them.
+@torch.jit.script
+def _sender_rewards(base_rewards, msg_lengths, max_len: float, penalty: float):
+    rewards = (base_rewards - (msg_lengths >= max_len).float()) # Shape: (batch size)
+    if(penalty > 0.0):
+        rewards = (rewards - (1.0 - (1.0 / (1.0 + (penalty * msg_lengths))))) # Shape: (batch size)
+    return rewards
+
 # In this game, there is one sender (Alice) and one receiver (Bob).
 # They are both trained to maximise the probability assigned by Bob to a "target image" in the following context: Alice is shown an "original image" and produces a message, Bob sees the message and then the target image and a "distractor image".
 # Alice is trained with REINFORCE; Bob is trained by log-likelihood maximization.
@@ -53,6 +80,12 @@ class AliceBob(Game):
 
         self._optim = build_optimizer(parameters, args.learning_rate)
 
+        self.torch_compile = args.torch_compile
+        self.use_amp = args.use_amp
+        if(self.torch_compile): # The compiled wrappers share their parameters with the original modules, so the optimizer built above is unaffected
+            self._sender = torch.compile(self._sender, mode="reduce-overhead")
+            self._receiver = torch.compile(self._receiver, mode="reduce-overhead")
+
         self.use_baseline = args.use_baseline
         if(self.use_baseline): # In that case, the loss will take into account the "baseline term" into the average recent reward.
             # Currently, the sender and receiver's rewards are the same, but we could imagine a setting in which they are different.
@@ -90,6 +123,13 @@ class AliceBob(Game):
             self.receiver_preprocessor = nn.Identity()
 
 
+    # Wraps the agents in DistributedDataParallel for multi-process data parallelism (with --distributed, one process per GPU launched with torchrun).
+    # Only the training forward passes go through the wrappers (so that DDP's bucketed all-reduce averages the gradients across ranks, overlapped with the backward pass); `self.sender`/`self.receiver` keep exposing the underlying modules, whose methods the evaluation code calls directly.
+    def wrap_distributed(self, args):
+        device_ids = ([args.device.index] if(args.device.type == 'cuda') else None)
+        self._ddp_sender = nn.parallel.DistributedDataParallel(self._sender, device_ids=device_ids)
+        self._ddp_receiver = nn.parallel.DistributedDataParallel(self._receiver, device_ids=device_ids)
+
     @property
     def sender(self):
         return self._sender
@@ -125,8 +165,17 @@ class AliceBob(Game):
     # batch: Batch
     def _bob_input(self, batch):
         with torch.no_grad():
-            ipts = torch.cat([batch.target_img(stack=True).unsqueeze(1), batch.base_distractors_img(stack=True)], dim=1)
-            ipts = self.receiver_preprocessor(ipts.flatten(0, 1)).view(*ipts.shape).detach()
+            target_img = batch.target_img(stack=True)
+            distractors_img = batch.base_distractors_img(stack=True)
+            shape = (target_img.size(0), (1 + distractors_img.size(1)), *target_img.shape[1:])
+            # The images are written into a preallocated buffer instead of torch.cat allocating a fresh [batch, (1 + distractors), C, H, W] tensor per forward pass.
+            # Reuse is safe: by the time the buffer is overwritten for a step, the previous step's graph (which read from it) has been consumed by its backward.
+            buf = getattr(self, '_bob_buf', None)
+            if((buf is None) or (buf.shape != shape) or (buf.device != target_img.device)):
+                buf = self._bob_buf = torch.empty(shape, dtype=target_img.dtype, device=target_img.device)
+            buf[:, 0].copy_(target_img)
+            buf[:, 1:].copy_(distractors_img)
+            ipts = self.receiver_preprocessor(buf.flatten(0, 1)).view(*shape).detach()
         return ipts
 
     def __call__(self, batch):
@@ -140,8 +189,10 @@ class AliceBob(Game):
         return self.alice_to_bob(batch)
 
     def alice_to_bob(self, batch):
-        sender = self.sender
-        receiver = self.receiver
+        sender = getattr(self, '_ddp_sender', None) # The DDP wrappers, when training with --distributed
+        receiver = getattr(self, '_ddp_receiver', None)
+        if(sender is None): sender = self.sender
+        if(receiver is None): receiver = self.receiver
 
         sender_outcome = sender(self._alice_input(batch))
         receiver_outcome = receiver(self._bob_input(batch), *sender_outcome.action)
@@ -166,7 +217,7 @@ class AliceBob(Game):
 
         msg_length = sender_outcome.action[1].float().mean()
 
-        return optimization, sender_rewards, sender_perf, msg_length, sender_entropy, receiver_entropy
+        return optimization, sender_rewards, sender_perf, msg_length, sender_entropy, receiver_entropy, sender_outcome.action[0].detach() # The messages come last; the autologger uses them for its language-progress and entropy logs
 
     # Returns two tensors of shape (batch size).
     # sender_action: pair (message, length) where message is a tensor of shape (batch size, max message length) and length a tensor of shape (batch size)
@@ -180,17 +231,12 @@ class AliceBob(Game):
 
         perf = receiver_pointing['dist'].probs[:, target_idx].detach() # Shape: (batch size)
 
-        if(self.use_expectation): rewards = perf.clone() # Shape: (batch size)
-        else: rewards = (receiver_pointing['action'] == target_idx).float() # Shape: (batch size)
+        if(self.use_expectation): base_rewards = perf # Out-of-place arithmetic below, so no defensive clone is needed
+        else: base_rewards = (receiver_pointing['action'] == target_idx).float() # Shape: (batch size)
 
         msg_lengths = sender_action[1].view(-1).float() # Shape: (batch size)
 
-        rewards += -1 * (msg_lengths >= self.max_len_msg) # -1 reward anytime we reach the message length limit
-
-        if(self.penalty > 0.0):
-            length_penalties = 1.0 - (1.0 / (1.0 + self.penalty * msg_lengths.float())) # Equal to 0 when `args.penalty` is set to 0, increases to 1 with the length of the message otherwise
-
-            rewards = (rewards - length_penalties) # Shape: (batch size)
+        rewards = _sender_rewards(base_rewards, msg_lengths, float(self.max_len_msg), float(self.penalty)) # Shape: (batch size); the scripted pointwise reward chain
 
         return (rewards, perf)
 
@@ -230,16 +276,16 @@ class AliceBob(Game):
         if(contending_imgs is None): img_scores = receiver_scores # Shape: (batch size, nb img)
         else: img_scores = torch.stack([receiver_scores[:,i] for i in contending_imgs], dim=1) # Shape: (batch size, len(contending_imgs))
 
-        # Generates a probability distribution from the scores and points at an image.
-        receiver_pointing = misc.pointing(img_scores)
+        loss = 0.0
 
-        perf = receiver_pointing['dist'].probs[:, target_idx].detach() # Shape: (batch size)
+        if(use_REINFORCE): # REINFORCE
+            # Generates a probability distribution from the scores and points at an image.
+            receiver_pointing = misc.pointing(img_scores)
 
-        entropy = receiver_pointing['dist'].entropy().mean() # Shape: ()
+            perf = receiver_pointing['dist'].probs[:, target_idx].detach() # Shape: (batch size)
 
-        loss = 0.0
+            entropy = receiver_pointing['dist'].entropy().mean() # Shape: ()
 
-        if(use_REINFORCE): # REINFORCE
             log_prob = receiver_pointing['dist'].log_prob(receiver_pointing['action']) # The log-probabilities of the selected images. Shape: (batch size)
 
             if(self.use_expectation): rewards = perf.clone() # Shape: (batch size)
@@ -253,9 +299,14 @@ class AliceBob(Game):
             reinforce_loss = -((rewards - r_baseline) * log_prob).mean()
             loss += reinforce_loss
         else: # Cross-entropy maximization
-            log_prob = receiver_pointing['dist'].log_prob(torch.tensor(target_idx, device=img_scores.device)) # The log-probabilities of the target images. Shape: (batch size)
+            # No action needs to be sampled on this path, so the log-softmax is taken once and indexed directly instead of building a Categorical
+            logp = F.log_softmax(img_scores, dim=-1) # Shape: (batch size, nb img)
 
-            cross_entropy_loss = -log_prob.mean() # Shape: ()
+            perf = logp[:, target_idx].exp().detach() # Shape: (batch size)
+
+            entropy = -(logp.exp() * logp).sum(dim=-1).mean() # Shape: ()
+
+            cross_entropy_loss = -logp[:, target_idx].mean() # The log-probabilities of the target images. Shape: ()
             loss += cross_entropy_loss
 
         # Entropy penalty
@@ -621,7 +672,8 @@ class AliceBob(Game):
 
         # Message Bob-model visualisation (inspired by Simonyan et al. 2013)
         #receiver_dream = add_normal_noise((0.5 + torch.zeros_like(batch.original_img)), std_dev=0.1, clamp_values=(0,1)) # Starts with normally-random images
-        receiver_dream = torch.stack([data_iterator.average_image() for _ in range(batch_size)]) # Starts with the average of the dataset
+        avg_img = data_iterator.average_image() # Memoised by the data iterator
+        receiver_dream = avg_img.unsqueeze(0).expand(batch_size, *avg_img.shape) # Starts with the average of the dataset; a broadcast view, materialised by the `.clone()` below
         #show_imgs([data_iterator.average_image()], 1)
         receiver_dream = receiver_dream.unsqueeze(axis=1) # Because the receiver expect a 1D array of images per batch instance; shape: [batch_size, 1, 3, height, width]
         receiver_dream = receiver_dream.clone().detach() # Creates a leaf that is a copy of `receiver_dream`
@@ -629,14 +681,7 @@ class AliceBob(Game):
 
         encoded_message = self.receiver.encode_message(*sender_outcome.action).detach()
 
-        # Defines a filter for checking smoothness
-        channels = 3
-        filter_weight = torch.tensor([[1.2, 2, 1.2], [2, -12.8, 2], [1.2, 2, 1.2]]) # -12.8 (at the center) is equal to the opposite of the sum of the other coefficients
-        filter_weight = filter_weight.view(1, 1, 3, 3)
-        filter_weight = filter_weight.repeat(channels, 1, 1, 1) # Shape: [channel, 1, 3, 3]
-        filter_layer = torch.nn.Conv2d(in_channels=channels, out_channels=channels, kernel_size=3, groups=channels, bias=False)
-        filter_layer.weight.data = filter_weight
-        filter_layer.weight.requires_grad = False
+        filter_weight = _laplacian_for(receiver_dream.device) # The module-level smoothness filter (cached per device), applied functionally (torch.conv2d) inside the scripted `_dream_penalties`
 
         #optimizer = torch.optim.RMSprop([receiver_dream], lr=10.0*args.learning_rate)
         optimizer = torch.optim.SGD([receiver_dream], lr=2*learning_rate, momentum=0.9)
@@ -651,15 +696,7 @@ class AliceBob(Game):
             tmp_outcome = self.receiver.aux_forward(receiver_dream, encoded_message)
             loss = -tmp_outcome.scores[:, 0].sum()
 
-            regularisation_loss = 0.0
-            #regularisation_loss += 0.05 * (receiver_dream - 0.5).norm(2) # Similar to L2 regularisation but centered around 0.5
-            regularisation_loss += 0.01 * (receiver_dream - 0.5).norm(1) # Similar to L1 regularisation but centered around 0.5
-            #regularisation_loss += -0.1 * torch.log(1.0 - (2 * torch.abs(receiver_dream - 0.5))).sum() # "Wall" at 0 and 1
-            loss += regularisation_loss
-
-            #smoothness_loss = 20 * torch.abs(filter_layer(receiver_dream.squeeze(axis=1))).sum()
-            smoothness_loss = 20 * torch.abs(filter_layer(receiver_dream.squeeze(axis=1))).norm(1)
-            loss += smoothness_loss
+            loss += _dream_penalties(receiver_dream, filter_weight) # L1 regularisation (centered around 0.5) and smoothness penalty, in one scripted call
 
             loss.backward()
 
@@ -667,7 +704,7 @@ class AliceBob(Game):
             # This can probably be done by modifying receiver_dream.grad.
 
             optimizer.step()
-            optimizer.zero_grad()
+            optimizer.zero_grad(set_to_none=True) # Frees the gradient buffer instead of zeroing it (no kernel launch)
 
         receiver_dream = receiver_dream.squeeze(axis=1)
         receiver_dream = torch.clamp(receiver_dream, 0, 1)
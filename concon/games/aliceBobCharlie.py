@@ -1,4 +1,5 @@
 import torch
+import torch.nn as nn
 import torchvision
 import numpy as np
 import scipy
@@ -49,6 +50,13 @@ class AliceBobCharlie(AliceBob):
         self._optim_receiver = build_optimizer(self.receiver.parameters(), args.learning_rate)
         self._optim_drawer = build_optimizer(self.drawer.parameters(), args.learning_rate)
 
+        self.torch_compile = args.torch_compile
+        self.use_amp = args.use_amp
+        if(self.torch_compile): # The compiled wrappers share their parameters with the original modules, so the optimizers built above are unaffected
+            self._sender = torch.compile(self._sender, mode="reduce-overhead")
+            self._receiver = torch.compile(self._receiver, mode="reduce-overhead")
+            self._drawer = torch.compile(self._drawer, mode="reduce-overhead")
+
         self.score_trackers = {
             'sender': misc.Averager(1280, buffer_f=(lambda size, dtype: torch.zeros(size, dtype=dtype).to(args.device))),
             'receiver': misc.Averager(1280, buffer_f=(lambda size, dtype: torch.zeros(size, dtype=dtype).to(args.device))),
@@ -90,6 +98,16 @@ class AliceBobCharlie(AliceBob):
         if(self.shared): raise NotImplementedError
         return self.all_agents
 
+    # Overrides AliceBob.wrap_distributed.
+    # All three agents get a wrapper, and the training forwards in `__call__` route through them; otherwise no gradient would ever be all-reduced and the ranks would silently train divergent models.
+    def wrap_distributed(self, args):
+        if(self.loss_weight_temp == 0.0): # In that case, only the currently worst agent's backward runs each step, which would leave the other wrappers' pending reductions unfinished and desynchronise the ranks.
+            raise NotImplementedError("--distributed requires soft loss weighting (loss_weight_temp != 0) in the Charlie game")
+
+        super().wrap_distributed(args)
+        device_ids = ([args.device.index] if(args.device.type == 'cuda') else None)
+        self._ddp_drawer = nn.parallel.DistributedDataParallel(self._drawer, device_ids=device_ids)
+
     # batch: Batch
     # forged_img: tensor of shape [args.batch_size, *IMG_SHAPE]
     # Overrides AliceBob._bob_input.
@@ -111,9 +129,12 @@ class AliceBobCharlie(AliceBob):
             sender_outcome: sender.Outcome
             receiver_outcome: receiver.Outcome
         """
-        sender = self.sender
-        receiver = self.receiver
-        drawer = self.drawer
+        sender = getattr(self, '_ddp_sender', None) # The DDP wrappers, when training with --distributed
+        receiver = getattr(self, '_ddp_receiver', None)
+        drawer = getattr(self, '_ddp_drawer', None)
+        if(sender is None): sender = self.sender
+        if(receiver is None): receiver = self.receiver
+        if(drawer is None): drawer = self.drawer
 
         sender_outcome = sender(self._alice_input(batch))
         drawer_outcome = drawer(*sender_outcome.action, use_spigot=use_spigot)
@@ -1,6 +1,5 @@
 import torch
 import torch.nn as nn
-import random
 import itertools
 from datetime import datetime
 
@@ -41,6 +40,7 @@ class AliceBobPopulation(AliceBob):
         self.senders, self.receivers, self._agents = nn.ModuleList(senders), nn.ModuleList(receivers), nn.ModuleList(agents)
 
         self._sender, self._receiver = None, None # These properties will be set before each episode by `start_episode`.
+        self._pair_rng = torch.Generator().manual_seed(torch.initial_seed()) # Pair selection follows torch.manual_seed (instead of Python's RNG), making runs reproducible and resumable deterministically
 
         # Mathusalemian dynamics:
         # If `_reaper_step` is an integer, at the beginning of each `_reaper_step` training epoch, one agent is reinitialized.
@@ -62,6 +62,12 @@ class AliceBobPopulation(AliceBob):
 
         self._optim = build_optimizer(self._agents.parameters(), args.learning_rate)
 
+        self.torch_compile = args.torch_compile
+        self.use_amp = args.use_amp
+        if(self.torch_compile): # The compiled wrappers share their parameters with the original modules, so the optimizer built above and the reaper (which reinitializes the underlying parameters) are unaffected
+            self.senders = nn.ModuleList([torch.compile(sender, mode="reduce-overhead") for sender in self.senders])
+            self.receivers = nn.ModuleList([torch.compile(receiver, mode="reduce-overhead") for receiver in self.receivers])
+
         self.use_baseline = args.use_baseline
         if(self.use_baseline): # In that case, the loss will take into account the "baseline term", into the average recent reward.
             # Currently, the sender and receiver's rewards are the same, but we could imagine a setting in which they are different.
@@ -94,10 +100,20 @@ class AliceBobPopulation(AliceBob):
         if(self.shared): raise NotImplementedError
         return self.all_agents
 
+    # Overrides AliceBob.wrap_distributed.
+    # Each agent gets its own DistributedDataParallel wrapper. The per-episode pair selection is drawn from identically seeded generators on every rank, so all ranks train the same pair and the pair's gradient all-reduce is a collective over the full process group (ranks picking different pairs would leave the collectives incomplete and hang).
+    def wrap_distributed(self, args):
+        device_ids = ([args.device.index] if(args.device.type == 'cuda') else None)
+        self._ddp_senders = [nn.parallel.DistributedDataParallel(sender, device_ids=device_ids) for sender in self.senders]
+        self._ddp_receivers = [nn.parallel.DistributedDataParallel(receiver, device_ids=device_ids) for receiver in self.receivers]
+        self._pair_rng = torch.Generator().manual_seed(42) # Same seed on every rank, so the selection sequences coincide
+
     # Overrides Game.start_episode.
     def start_episode(self, train_episode=True):
-        self._sender = random.choice(self.senders)
-        self._receiver = random.choice(self.receivers)
+        idx = torch.randint(len(self.senders), (2,), generator=self._pair_rng).tolist() # One draw for both indices (and identical on every rank when distributed, see `wrap_distributed`)
+        self._sender, self._receiver = self.senders[idx[0]], self.receivers[idx[1]]
+        if(getattr(self, '_ddp_senders', None) is not None):
+            self._ddp_sender, self._ddp_receiver = self._ddp_senders[idx[0]], self._ddp_receivers[idx[1]] # Used by `alice_to_bob` for the training forwards
 
         super().start_episode(train_episode=train_episode)
 
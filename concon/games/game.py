@@ -1,6 +1,9 @@
 from abc import ABCMeta, abstractmethod
+import contextlib
 from datetime import datetime
+import functools
 import itertools as it
+import threading
 import time
 
 import torch
@@ -14,6 +17,18 @@ from ..utils.misc import build_optimizer, Unflatten
 from ..utils.modules import MultiHeadsClassifier
 from ..utils.data import Batch
 
+# Compiling the step fuses the per-parameter elementwise updates into a few foreach kernels instead of one tiny kernel per parameter tensor
+@torch.compile(fullgraph=False)
+def _compiled_optim_step(optim):
+    optim.step()
+
+# Recursively copies every tensor of a (possibly nested) state dict to the CPU, so that a checkpoint can be written in the background while training keeps updating the live tensors
+def _state_to_cpu(obj):
+    if(torch.is_tensor(obj)): return obj.detach().to('cpu', copy=True) # copy=True: .cpu() alone returns the live tensor itself when it already resides on the CPU, and the snapshot must not alias tensors that optim.step() keeps mutating while the write runs
+    if(isinstance(obj, dict)): return {k: _state_to_cpu(v) for (k, v) in obj.items()}
+    if(isinstance(obj, list)): return [_state_to_cpu(v) for v in obj]
+    return obj
+
 class Game(metaclass=ABCMeta):
     @abstractmethod
     def test_visualize(self, data_iterator, learning_rate):
@@ -91,6 +106,18 @@ class Game(metaclass=ABCMeta):
         if train_episode: self.train()
         else: self.eval()
 
+    # Returns a bfloat16 autocast context when the game was built with --use_amp, and a null context otherwise (bfloat16 needs no GradScaler)
+    def amp_context(self):
+        if(getattr(self, 'use_amp', False)):
+            device_type = next(self.all_agents[0].parameters()).device.type
+            return torch.autocast(device_type, dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+
+    # Steps an optimizer, through the compiled helper when the game was built with --torch_compile
+    def optim_step(self, optim):
+        if(getattr(self, 'torch_compile', False)): _compiled_optim_step(optim)
+        else: optim.step()
+
     def start_epoch(self, data_iterator, summary_writer):
         """
         Called before starting a new epoch of the game. Override for setup/pretrain behavior.
@@ -115,6 +142,20 @@ class Game(metaclass=ABCMeta):
         """
 
         self.start_epoch(data_iterator, event_writer)
+        all_params = [p for a in self.all_agents for p in a.parameters()] # Materialised once per epoch; the autologger may iterate it every step for gradient stats # TODO `self.all_agents` or `self.current_agents`?
+
+        # The clipping configuration and the per-optimizer parameter lists do not change during the epoch, so the clipping calls are bound once per optimizer instead of being re-tested and rebuilt every step (lazily, since `compute_interaction` decides which optimizers take part in a step)
+        do_clip = ((self.grad_clipping > 0) or (self.grad_scaling > 0))
+        clippers = {} # From id(optim) to the list of bound clipping calls
+        def get_clippers(optim):
+            fs = clippers.get(id(optim))
+            if(fs is None):
+                params = [p for group in optim.param_groups for p in group["params"]]
+                fs = clippers[id(optim)] = []
+                if(self.grad_clipping > 0): fs.append(functools.partial(torch.nn.utils.clip_grad_value_, params, self.grad_clipping, foreach=True))
+                if(self.grad_scaling > 0): fs.append(functools.partial(torch.nn.utils.clip_grad_norm_, params, self.grad_scaling, foreach=True))
+            return fs
+
         with self.autologger:
             start_index = (epoch_index * steps_per_epoch)
             end_index = (start_index + steps_per_epoch)
@@ -123,7 +164,8 @@ class Game(metaclass=ABCMeta):
 
                 batch = data_iterator.get_batch(data_type='train', keep_category=self.autologger.log_lang_progress) # If `self.autologger.log_lang_progress` is True, the autologger will need to access the categories of the images in the batch.
 
-                optimization, *external_output = self.compute_interaction(batch, epoch_index=epoch_index, iter_index=iter_index)
+                with self.amp_context():
+                    optimization, *external_output = self.compute_interaction(batch, epoch_index=epoch_index, iter_index=iter_index)
 
                 # RMK: It could be easier to have all of the optimization within `compute_interaction` (possibly renamed).
                 for i, (_, _, backward_f) in enumerate(optimization):
@@ -131,22 +173,18 @@ class Game(metaclass=ABCMeta):
                     backward_f(retain_graph) # Backpropagation
 
                 for (optim, loss, _) in optimization:
-                    # Gradient clipping and scaling
-                    if(self.grad_clipping > 0):
-                        for group in optim.param_groups: torch.nn.utils.clip_grad_value_(group["params"], self.grad_clipping)
-                        #for agent in self.current_agents: torch.nn.utils.clip_grad_value_(agent.parameters(), self.grad_clipping)
-                    if(self.grad_scaling > 0):
-                        for group in optim.param_groups: torch.nn.utils.clip_grad_norm_(group["params"], self.grad_scaling)
-                        #for agent in self.current_agents: torch.nn.utils.clip_grad_norm_(agent.parameters(), self.grad_scaling)
+                    # Gradient clipping and scaling: a single fused (foreach) call over all parameter groups, instead of one elementwise kernel per parameter per group
+                    if(do_clip):
+                        for clip in get_clippers(optim): clip()
 
-                    optim.step() # Parameters update. Should not be performed until all gradients have been computed.
-                    optim.zero_grad() # Reinitialization of the gradient buffers.
+                    self.optim_step(optim) # Parameters update. Should not be performed until all gradients have been computed.
+                    optim.zero_grad(set_to_none=True) # Reinitialization of the gradient buffers (freed rather than zeroed: no kernel launch, and the allocator pools the memory).
 
                 # TODO This needs an update.
                 udpated_state = self.autologger.update(
                     torch.tensor(0.0), # This is where "the loss" should be, but I'm logging the losses directly in compute_interaction.
                     *external_output,
-                    parameters=(p for a in self.all_agents for p in a.parameters()), # TODO `self.all_agents` or `self.current_agents`?
+                    parameters=all_params,
                     batch=batch,
                     index=iter_index,
                 )
@@ -154,12 +192,15 @@ class Game(metaclass=ABCMeta):
     def save(self, path):
         """
         Saves the model to the file `path`.
+        Only the snapshot (CPU copies of the state) is taken synchronously; the disk write runs on a background thread so that training resumes immediately.
         """
         state = {
-            'agents_state_dicts': [agent.state_dict() for agent in self.all_agents],
-            'optims': self.optims,
+            'agents_state_dicts': [_state_to_cpu(agent.state_dict()) for agent in self.all_agents],
+            'optim_state_dicts': [_state_to_cpu(optim.state_dict()) for optim in self.optims], # Only the tensor state and the hyperparameters are serialized, not the live optimizer objects (smaller and more robust across PyTorch versions)
         }
-        torch.save(state, path)
+        if(getattr(self, '_save_thread', None) is not None): self._save_thread.join() # At most one pending write, so checkpoints reach the disk in order
+        self._save_thread = threading.Thread(target=torch.save, args=(state, path), kwargs={'_use_new_zipfile_serialization': True}) # Non-daemon on purpose: the interpreter waits for it at exit, so the final checkpoint cannot be killed mid-write
+        self._save_thread.start()
 
     @classmethod
     def load(cls, path, args):
@@ -169,7 +210,8 @@ class Game(metaclass=ABCMeta):
         for agent, state_dict in zip(instance.all_agents, checkpoint['agents_state_dicts']):
             agent.load_state_dict(state_dict)
 
-        instance._optim = checkpoint['optims'][0]
+        for optim, state_dict in zip(instance.optims, checkpoint['optim_state_dicts']): # The optimizers are rebuilt by `cls(args)` above; only their state is restored
+            optim.load_state_dict(state_dict)
 
         return instance
 
@@ -178,8 +220,18 @@ class Game(metaclass=ABCMeta):
 
     # TODO: pretraining should be handled by a separate, dedicated object
     def pretrain_CNNs(self, data_iterator, pretrain_CNN_mode='category-wise', freeze_pretrained_CNN=False, learning_rate=0.0001, epochs=5, steps_per_epoch=1000, display_mode='', pretrain_CNNs_on_eval=False, deconvolution_factory=None, convolution_factory=None):
-        pretrained_models = {}
         agents = self.agents_for_CNN_pretraining()
+
+        # In classification mode, the agents' CNNs are independent, so they are all trained over a single pass on the data (one batch feeds every agent, with a single combined optimizer) instead of one full sequential pass per agent
+        if((pretrain_CNN_mode != 'auto-encoder') and (len(agents) > 1)):
+            pretrained_models = self._pretrain_classif_joint(agents, data_iterator, pretrain_CNN_mode, learning_rate, epochs, steps_per_epoch, display_mode, pretrain_CNNs_on_eval)
+            if(freeze_pretrained_CNN):
+                for agent in agents:
+                    for p in agent.image_encoder.parameters():
+                        p.requires_grad = False
+            return pretrained_models
+
+        pretrained_models = {}
         for i, agent in enumerate(agents):
             agent_name = f"agent {i}"
             pretrained_models[agent_name] = self.pretrain_agent_CNN(agent, data_iterator, pretrain_CNN_mode, freeze_pretrained_CNN, learning_rate, epochs, steps_per_epoch, display_mode, pretrain_CNNs_on_eval, deconvolution_factory, convolution_factory, agent_name=agent_name)
@@ -204,70 +256,82 @@ class Game(metaclass=ABCMeta):
 
         return pretrained_model
 
-    # Pretrains the CNN of an agent in category- or feature-wise mode
-    def _pretrain_classif(self, agent, data_iterator, pretrain_CNN_mode='category-wise', learning_rate=0.0001, epochs=5, steps_per_epoch=1000, display_mode='', pretrain_CNNs_on_eval=False, agent_name="agent"):
-        loss_tag = 'pretrain/loss_%s_%s' % (agent_name, pretrain_CNN_mode)
-        acc_tag = 'pretrain/acc_%s_%s' % (agent_name, pretrain_CNN_mode)
-
+    # Builds the fused classification head (and its target-extraction function) used to pretrain an agent's CNN in category- or feature-wise mode
+    def _build_classif_head(self, agent, data_iterator, pretrain_CNN_mode):
         concept_sizes = [len(concept) for concept in data_iterator.concepts]
         xcoder = agent.message_decoder if hasattr(agent, 'message_decoder') else agent.message_encoder
         hidden_size = xcoder.symbol_embeddings.weight.size(1)
         device = next(agent.parameters()).device
 
         if pretrain_CNN_mode == 'feature-wise':
-            # Defines one classification head per non-unary concept
-            heads = nn.ModuleList([
-                nn.Sequential(
-                    nn.Linear(50, 3), # I guess the 3 could be replaced with csize
-                    nn.LogSoftmax(dim=1)
-                ) for csize in concept_sizes if csize > 1
-            ]).to(device)
+            # One classification head per non-unary concept
+            n_heads = len([csize for csize in concept_sizes if csize > 1])
+            n_classes = 3 # I guess the 3 could be replaced with csize
             get_head_targets = (lambda cat: [v for v, csize in zip(cat, concept_sizes) if csize > 1])
         else:
-            heads = nn.ModuleList([
-                nn.Sequential(
-                    nn.Linear(50, data_iterator.nb_categories),
-                    nn.LogSoftmax(dim=1))
-                ]
-            ).to(device)
+            n_heads = 1
+            n_classes = data_iterator.nb_categories
             get_head_targets = (lambda cat: [data_iterator.category_idx(cat)])
+        # All heads share their input and output sizes, so they are fused into a single linear layer (one GEMM instead of one small GEMM per head); head i occupies the output rows [i * n_classes, (i + 1) * n_classes)
+        heads = nn.Linear(hidden_size, (n_heads * n_classes)).to(device)
+
+        # The category-to-targets mapping is static, so it is memoised instead of being recomputed for every datapoint of every batch
+        raw_get_head_targets = get_head_targets
+        head_targets_cache = {}
+        def get_head_targets(cat):
+            cat = tuple(cat)
+            targets = head_targets_cache.get(cat)
+            if(targets is None): targets = head_targets_cache.setdefault(cat, raw_get_head_targets(cat))
+            return targets
+
+        return (heads, n_heads, n_classes, get_head_targets, device)
+
+    # Pretrains the CNN of an agent in category- or feature-wise mode
+    def _pretrain_classif(self, agent, data_iterator, pretrain_CNN_mode='category-wise', learning_rate=0.0001, epochs=5, steps_per_epoch=1000, display_mode='', pretrain_CNNs_on_eval=False, agent_name="agent"):
+        loss_tag = 'pretrain/loss_%s_%s' % (agent_name, pretrain_CNN_mode)
+        acc_tag = 'pretrain/acc_%s_%s' % (agent_name, pretrain_CNN_mode)
+
+        heads, n_heads, n_classes, get_head_targets, device = self._build_classif_head(agent, data_iterator, pretrain_CNN_mode)
 
         optimizer = build_optimizer(it.chain(agent.image_encoder.parameters(), heads.parameters()), learning_rate)
-        n_heads = len(heads)
 
-        model = MultiHeadsClassifier(agent.image_encoder, optimizer, heads, n_heads, get_head_targets, device)
+        model = MultiHeadsClassifier(agent.image_encoder, optimizer, heads, n_heads, n_classes, get_head_targets, device)
 
         total_items = 0
+        get_batch = data_iterator.get_batch # Bound once; the step path below should only go through locals, not repeated attribute chases
+        add_scalar = (self.autologger.summary_writer.add_scalar if(self.autologger.summary_writer is not None) else None)
         for epoch_index in range(epochs):
             # Optimization
             pbar = Progress.get_progress_cls(display_mode)(steps_per_epoch, epoch_index, logged_items={'L', 'acc'})
             epoch_hits, epoch_items = 0., 0. # TODO Do they need to be floats instead of integers?
             with pbar:
                 for step_i in range(steps_per_epoch):
-                    batch = data_iterator.get_batch(data_type='train', keep_category=True, no_evaluation=(not pretrain_CNNs_on_eval), sampling_strategies=[]) # For each instance of the batch, one original and one target image, but no distractor; only the target will be used
+                    batch = get_batch(data_type='train', keep_category=True, no_evaluation=(not pretrain_CNNs_on_eval), sampling_strategies=[]) # For each instance of the batch, one original and one target image, but no distractor; only the target will be used
 
-                    hits, loss = model.run_batch(batch)
+                    with self.amp_context():
+                        hits, loss = model.run_batch(batch)
 
-                    for x in hits: epoch_hits += x.sum().item()
+                    batch_hits, loss_value = torch.stack([torch.stack([x.sum() for x in hits]).sum(), loss.detach()]).tolist() # A single device-to-host synchronisation per step, covering all heads and the loss
+                    epoch_hits += batch_hits
                     epoch_items += batch.size
                     total_items += batch.size
 
-                    if(self.autologger.summary_writer is not None):
-                        self.autologger.summary_writer.add_scalar(loss_tag, (loss.item() / batch.size), total_items)
-                        self.autologger.summary_writer.add_scalar(acc_tag, (epoch_hits / (epoch_items * n_heads)), total_items)
-                    pbar.update(L=loss.item(), acc=(epoch_hits / (epoch_items * n_heads)))
+                    if(add_scalar is not None):
+                        add_scalar(loss_tag, (loss_value / batch.size), total_items)
+                        add_scalar(acc_tag, (epoch_hits / (epoch_items * n_heads)), total_items)
+                    pbar.update(L=loss_value, acc=(epoch_hits / (epoch_items * n_heads)))
 
             # Evaluation
             with torch.no_grad():
                 agent.image_encoder.eval()
                 heads.eval()
-                test_loss, test_epoch_hits, test_epoch_items =  0., 0, 0
+                test_totals, test_epoch_items = [], 0
                 for step_i in range(1 + (steps_per_epoch // 10)):
                     batch = data_iterator.get_batch(data_type='test', keep_category=True, no_evaluation=(not pretrain_CNNs_on_eval), sampling_strategies=[]) # For each instance of the batch, one original and one target image, but no distractor; only the target will be use
                     hits, losses = model.forward(batch)
-                    for x in losses: test_loss += x.sum().item()
-                    for x in hits: test_epoch_hits += x.sum().item()
+                    test_totals.append(torch.stack([torch.stack([x.sum() for x in losses]).sum(), torch.stack([x.sum() for x in hits]).sum()])) # Accumulated on device; summing over all heads at once avoids one `.item()` synchronisation per head per step
                     test_epoch_items += batch.size
+                test_loss, test_epoch_hits = torch.stack(test_totals).sum(dim=0).tolist() # A single device-to-host synchronisation for the whole evaluation
                 test_loss = test_loss / (test_epoch_items * n_heads)
                 test_acc = test_epoch_hits / (test_epoch_items * n_heads)
                 if(self.autologger.summary_writer is not None):
@@ -279,6 +343,82 @@ class Game(metaclass=ABCMeta):
 
         return model
 
+    # Pretrains the CNNs of several agents at once in category- or feature-wise mode.
+    # The agents' CNNs are independent, so instead of one full sequential pass over the data per agent, every batch feeds all agents, their losses are summed and a single combined optimizer steps them together; the data pipeline and the per-step Python overhead are thus paid once instead of once per agent.
+    def _pretrain_classif_joint(self, agents, data_iterator, pretrain_CNN_mode='category-wise', learning_rate=0.0001, epochs=5, steps_per_epoch=1000, display_mode='', pretrain_CNNs_on_eval=False):
+        agent_names = [("agent %i" % i) for i in range(len(agents))]
+        print(("[%s] pretraining %s jointly…" % (datetime.now(), ", ".join(agent_names))), flush=True)
+        loss_tags = [('pretrain/loss_%s_%s' % (agent_name, pretrain_CNN_mode)) for agent_name in agent_names]
+        acc_tags = [('pretrain/acc_%s_%s' % (agent_name, pretrain_CNN_mode)) for agent_name in agent_names]
+
+        built = [self._build_classif_head(agent, data_iterator, pretrain_CNN_mode) for agent in agents]
+        optimizer = build_optimizer(it.chain.from_iterable(it.chain(agent.image_encoder.parameters(), heads.parameters()) for agent, (heads, _, _, _, _) in zip(agents, built)), learning_rate)
+        models = [MultiHeadsClassifier(agent.image_encoder, optimizer, heads, n_heads, n_classes, get_head_targets, device) for agent, (heads, n_heads, n_classes, get_head_targets, device) in zip(agents, built)]
+        n_heads = built[0][1] # All agents play the same game, so their heads have the same structure
+
+        total_items = 0
+        get_batch = data_iterator.get_batch # Bound once; the step path below should only go through locals, not repeated attribute chases
+        add_scalar = (self.autologger.summary_writer.add_scalar if(self.autologger.summary_writer is not None) else None)
+        for epoch_index in range(epochs):
+            # Optimization
+            pbar = Progress.get_progress_cls(display_mode)(steps_per_epoch, epoch_index, logged_items={'L', 'acc'})
+            epoch_hits, epoch_items = ([0.] * len(models)), 0.
+            with pbar:
+                for step_i in range(steps_per_epoch):
+                    batch = get_batch(data_type='train', keep_category=True, no_evaluation=(not pretrain_CNNs_on_eval), sampling_strategies=[]) # For each instance of the batch, one original and one target image, but no distractor; only the target will be used
+
+                    optimizer.zero_grad(set_to_none=True)
+                    hit_sums, losses = [], []
+                    with self.amp_context():
+                        for model in models: # The forwards are independent; their kernels queue back to back on the device without waiting on each other's results
+                            hits, head_losses = model.forward(batch)
+                            hit_sums.append(torch.stack([x.sum() for x in hits]).sum())
+                            losses.append(torch.stack([x.mean() for x in head_losses]).sum()) # As in MultiHeadsClassifier.run_batch: sum over heads of the mean over the batch
+                        loss = torch.stack(losses).sum() # Summed over agents, so that a single backward pass covers them all
+
+                    loss.backward()
+                    self.optim_step(optimizer)
+
+                    values = torch.stack(losses + hit_sums).tolist() # A single device-to-host synchronisation per step, covering all agents
+                    loss_values, batch_hits = values[:len(models)], values[len(models):]
+                    epoch_hits = [(e + b) for e, b in zip(epoch_hits, batch_hits)]
+                    epoch_items += batch.size
+                    total_items += batch.size
+
+                    if(add_scalar is not None):
+                        for loss_tag, acc_tag, loss_value, agent_hits in zip(loss_tags, acc_tags, loss_values, epoch_hits):
+                            add_scalar(loss_tag, (loss_value / batch.size), total_items)
+                            add_scalar(acc_tag, (agent_hits / (epoch_items * n_heads)), total_items)
+                    pbar.update(L=sum(loss_values), acc=(sum(epoch_hits) / (epoch_items * n_heads * len(models))))
+
+            # Evaluation
+            with torch.no_grad():
+                for model in models:
+                    model.image_encoder.eval()
+                    model.heads.eval()
+                test_totals, test_epoch_items = [], 0
+                for step_i in range(1 + (steps_per_epoch // 10)):
+                    batch = data_iterator.get_batch(data_type='test', keep_category=True, no_evaluation=(not pretrain_CNNs_on_eval), sampling_strategies=[]) # For each instance of the batch, one original and one target image, but no distractor; only the target will be use
+                    per_model = []
+                    for model in models:
+                        hits, head_losses = model.forward(batch)
+                        per_model.append(torch.stack([torch.stack([x.sum() for x in head_losses]).sum(), torch.stack([x.sum() for x in hits]).sum()]))
+                    test_totals.append(torch.stack(per_model)) # [n_models, 2]; accumulated on device
+                    test_epoch_items += batch.size
+                test_values = torch.stack(test_totals).sum(dim=0).tolist() # A single device-to-host synchronisation for the whole evaluation
+                for agent_name, loss_tag, acc_tag, (test_loss, test_epoch_hits) in zip(agent_names, loss_tags, acc_tags, test_values):
+                    test_loss = test_loss / (test_epoch_items * n_heads)
+                    test_acc = test_epoch_hits / (test_epoch_items * n_heads)
+                    if(self.autologger.summary_writer is not None):
+                        self.autologger.summary_writer.writer.add_scalar('eval-' + loss_tag, test_loss, epoch_index)
+                        self.autologger.summary_writer.writer.add_scalar('eval-' + acc_tag, test_acc, epoch_index)
+                    print(f"[eval-pretrain {agent_name} epoch {epoch_index}] L={test_loss}, acc={test_acc}")
+                for model in models:
+                    model.image_encoder.train()
+                    model.heads.train()
+
+        return dict(zip(agent_names, models))
+
     # Pretrains the CNN of an agent in auto-encoder mode
     def _pretrain_ae(self, agent, data_iterator, pretrain_CNN_mode='auto-encoder', deconvolution_factory=None, convolution_factory=None, learning_rate=0.0001, epochs=5, steps_per_epoch=1000, display_mode='', pretrain_CNNs_on_eval=False, agent_name="agent", _is_external_ae=False, device=None):
         loss_tag = 'pretrain/loss_%s_%s' % (agent_name, pretrain_CNN_mode)
@@ -304,6 +444,7 @@ class Game(metaclass=ABCMeta):
             Unflatten(),
             decoder,
         ).to(device)
+        if(getattr(self, 'torch_compile', False)): model = torch.compile(model, mode="reduce-overhead") # Captures the whole encoder+decoder forward as one graph
 
         optimizer = build_optimizer(model.parameters(), learning_rate)
 
@@ -317,22 +458,24 @@ class Game(metaclass=ABCMeta):
             pbar = Progress.get_progress_cls(display_mode)(steps_per_epoch, epoch_index, logged_items={'L'})
             with pbar:
                 for _ in range(steps_per_epoch):
-                    optimizer.zero_grad()
+                    optimizer.zero_grad(set_to_none=True)
 
                     batch = data_iterator.get_batch(data_type=data_type, keep_category=True, no_evaluation=(not pretrain_CNNs_on_eval), sampling_strategies=[])
                     batch_img = batch.target_img(stack=True)
-                    output = model(batch_img)
+                    with self.amp_context():
+                        output = model(batch_img)
 
-                    loss = F.mse_loss(output, batch_img, reduction="sum")
+                        loss = F.mse_loss(output, batch_img, reduction="mean") # With "sum" the gradient scaled with the batch size, effectively multiplying the learning rate by it
 
-                    epoch_loss += loss.item()
+                    batch_loss = (loss.item() * batch_img[0].numel()) # Per-image summed error, so that the logged values keep the same scale as with the previous "sum" reduction
+                    epoch_loss += (batch_loss * batch_img.size(0))
                     epoch_items += batch_img.size(0)
                     total_items += batch_img.size(0)
-                    if(self.autologger.summary_writer is not None): self.autologger.summary_writer.add_scalar(loss_tag, (loss.item() / batch_img.size(0)), total_items)
+                    if(self.autologger.summary_writer is not None): self.autologger.summary_writer.add_scalar(loss_tag, batch_loss, total_items)
                     pbar.update(L=(epoch_loss / epoch_items))
 
                     loss.backward()
-                    optimizer.step()
+                    self.optim_step(optimizer)
 
             # Evaluation
             with torch.no_grad():
@@ -342,8 +485,8 @@ class Game(metaclass=ABCMeta):
                     batch = data_iterator.get_batch(data_type='test', keep_category=True, no_evaluation=(not pretrain_CNNs_on_eval), sampling_strategies=[])
                     batch_img = batch.target_img(stack=True)
                     output = model(batch_img)
-                    loss = F.mse_loss(output, batch_img, reduction="sum")
-                    test_epoch_loss += loss.item()
+                    loss = F.mse_loss(output, batch_img, reduction="mean")
+                    test_epoch_loss += (loss.item() * batch_img.numel()) # Back to a summed error, as logged before the switch to the "mean" reduction
                     test_epoch_items += batch_img.size(0)
                 test_epoch_loss = test_epoch_loss / test_epoch_items
                 if(self.autologger.summary_writer is not None):
@@ -162,7 +162,7 @@ class DataPoint():
         self.img = img
 
     def toInput(self, keep_category=False, device=None, keep_idx=False):
-        img = self.img if(device is None) else self.img.to(device)
+        img = self.img if(device is None) else self.img.to(device, non_blocking=True) # Asynchronous when the host tensor is pinned (see SimpleDataset.__init__), so the copy overlaps with compute
         category = self.category if(keep_category) else None
         idx = self.idx if(keep_idx) else None
 
@@ -460,6 +460,11 @@ class SimpleDataset(Dataset):
             tensor_img = torchvision.transforms.functional.to_tensor(pil_img)
 
             dataset.append(DataPoint(idx, category, tensor_img))
+
+        # Pins the host-side images when the run targets CUDA, so that the per-datapoint host-to-device copies (see DataPoint.toInput) are asynchronous
+        if((device is not None) and (torch.device(device).type == 'cuda')):
+            for datapoint in dataset: datapoint.img = datapoint.img.pin_memory()
+
         self._dataset = np.array(dataset) # np.array[DataPoint]
 
         categories = defaultdict(list) # Will end as a dictionary from category (tuple) to Numpy array of DataPoint·s
@@ -2,6 +2,7 @@ from abc import ABCMeta, abstractmethod
 
 import numpy as np
 import torch
+import torch.nn.functional as F
 from torch.utils.tensorboard import SummaryWriter
 
 import tqdm
@@ -142,6 +143,7 @@ class AutoLogger(object):
         self.log_entropy = log_entropy
 
         self.device = device
+        self._symbol_arange = torch.arange(base_alphabet_size, device=device) # Constant, used by the entropy log; allocated once instead of per step
 
         if(no_summary):
             self.summary_writer = None
@@ -169,6 +171,8 @@ class AutoLogger(object):
             'total_items' : 0, # number of training instances since the beginning of the epoch
             'running_avg_reward' : 0.0,
             'running_avg_success' : 0.0,
+            'accum' : None, # Device-side accumulator of the per-step statistics; brought to the host in a single synchronisation per logging period (see `update`)
+            'accum_steps' : 0,
         }
         if self.summary_writer is not None:
             if self.log_lang_progress:
@@ -205,61 +209,73 @@ class AutoLogger(object):
         # TODO: the autologger needs some clean up for user simplicity. Ideally I'd love to have it in its own thread as well
 
         rewards, successes, msg_length, sender_entropy, receiver_entropy, *external_output = external_output
+        messages = (external_output[0] if(len(external_output) > 0) else None) # The sender's messages (a [batch, max len] tensor), when the game provides them; needed by the language-progress and entropy logs below
 
-        # Computes the minimum length the messages can have in order to get perfect accuracy (approximation when the size of the alphabet >> 1)
-        minimal_compression_len = np.log(self.data_loader.nb_categories) / np.log(self.base_alphabet_size + 1) # + 1 because EoM is taken into account
-        length_ratio = (msg_length / minimal_compression_len).item()
-
-        # updates running average reward
-        self._state['total_reward'] += rewards.sum().item()
-        self._state['total_success'] += successes.sum().item()
+        number_ex_seen = supplementary_info['index'] * supplementary_info['batch'].size
+        self._state['number_ex_seen'] = number_ex_seen
         self._state['total_items'] += supplementary_info['batch'].size
-        self._state['running_avg_reward'] = self._state['total_reward'] / self._state['total_items']
-        self._state['running_avg_success'] = self._state['total_success'] / self._state['total_items']
-
-        if self.summary_writer is not None:
-            avg_reward = rewards.mean().item() # average reward of the batch
-            avg_success = successes.mean().item() # average success of the batch
-            number_ex_seen = supplementary_info['index'] * supplementary_info['batch'].size
-            self._state['number_ex_seen'] = number_ex_seen
-
-            self._write('train/reward', avg_reward, number_ex_seen)
-            self._write('train/success', avg_success, number_ex_seen)
-            self._write('train/loss', loss.item(), number_ex_seen)
-            self._write('train/sender_entropy', sender_entropy.item(), number_ex_seen)
-            self._write('train/receiver_entropy', receiver_entropy.item(), number_ex_seen)
 
-            self._write('llp/msg_length', msg_length.item(), number_ex_seen)
-            self._write('llp/length_ratio', length_ratio, number_ex_seen)
+        # All per-step scalar statistics are accumulated on device and brought to the host in a single synchronisation per logging period, instead of one blocking `.item()` call per statistic per step
+        stats = torch.stack([rewards.sum(), successes.sum(), rewards.mean(), successes.mean(), loss.detach().to(rewards.device), sender_entropy.detach(), receiver_entropy.detach(), msg_length.detach()])
+        if(self._state['accum'] is None): self._state['accum'] = stats
+        else: self._state['accum'] += stats
+        self._state['accum_steps'] += 1
+
+        period = (self.summary_writer.default_period if(self.summary_writer is not None) else 1)
+        if(self._state['accum_steps'] >= period): # Synchronisation point
+            n = self._state['accum_steps']
+            (reward_sum, success_sum, reward_mean_sum, success_mean_sum, loss_sum, sender_entropy_sum, receiver_entropy_sum, msg_length_sum) = self._state['accum'].tolist()
+            self._state['accum'], self._state['accum_steps'] = None, 0
+
+            # updates running average reward
+            self._state['total_reward'] += reward_sum
+            self._state['total_success'] += success_sum
+            self._state['running_avg_reward'] = self._state['total_reward'] / self._state['total_items']
+            self._state['running_avg_success'] = self._state['total_success'] / self._state['total_items']
+
+            if self.summary_writer is not None:
+                # Computes the minimum length the messages can have in order to get perfect accuracy (approximation when the size of the alphabet >> 1)
+                minimal_compression_len = np.log(self.data_loader.nb_categories) / np.log(self.base_alphabet_size + 1) # + 1 because EoM is taken into account
+                length_ratio = ((msg_length_sum / n) / minimal_compression_len)
+
+                # The values below are already averaged over the logging period, so they are written directly instead of going through the summary writer's own averaging buffers
+                self._write('train/reward', (reward_mean_sum / n), number_ex_seen, direct=True)
+                self._write('train/success', (success_mean_sum / n), number_ex_seen, direct=True)
+                self._write('train/loss', (loss_sum / n), number_ex_seen, direct=True)
+                self._write('train/sender_entropy', (sender_entropy_sum / n), number_ex_seen, direct=True)
+                self._write('train/receiver_entropy', (receiver_entropy_sum / n), number_ex_seen, direct=True)
+
+                self._write('llp/msg_length', (msg_length_sum / n), number_ex_seen, direct=True)
+                self._write('llp/length_ratio', length_ratio, number_ex_seen, direct=True)
 
-            if self.log_lang_progress:
-                for batch in supplementary_info['batches']:
-                    batch_msg_manyhot = torch.zeros((batch.size, self.base_alphabet_size + 2), dtype=torch.float).to(self.device) # size of embeddings + EOS + PAD
-                    # message -> many-hot
-                    many_hots = batch_msg_manyhot.scatter_(1, sender_outcome.action[0].detach(), 1).narrow(1,1,self.base_alphabet_size).float()
-                    # summation along batch dimension, and add to counts
-                    self._state['current_dist'] += torch.einsum('bi,bj->ij', many_hots, batch.original_category.float().to(self.device)).detach().float()
-
-            if self.log_entropy:
-                new_messages = sender_outcome.action[0].view(-1)
-                valid_indices = torch.arange(self.base_alphabet_size).expand(new_messages.size(0), self.base_alphabet_size).to(self.device)
+        if self.summary_writer is not None:
+            if self.log_lang_progress and (messages is not None):
+                # message -> many-hot (symbol 0 — EOS/PAD — is dropped), then a single GEMM accumulates the per-symbol per-concept-value counts; no zero+scatter+narrow dance
+                many_hots = F.one_hot(messages, (self.base_alphabet_size + 2)).sum(dim=1)[:, 1:(self.base_alphabet_size + 1)].float()
+                categories = torch.tensor([dp.category for dp in supplementary_info['batch'].original], dtype=torch.float).to(self.device, non_blocking=True) # The host-to-device copy can overlap with the GEMM below
+                self._state['current_dist'] += (many_hots.t() @ categories)
+
+            if self.log_entropy and (messages is not None):
+                new_messages = messages.view(-1)
+                valid_indices = self._symbol_arange.expand(new_messages.size(0), self.base_alphabet_size) # A broadcast view of the cached arange; no per-step allocation or transfer
                 selected_symbols = valid_indices == new_messages.unsqueeze(1).float()
                 self._state['symbol_counts'] += selected_symbols.sum(dim=0)
 
-            if self.log_lang_progress and index % 100 == 0:
-                if self._state['past_dist'] is None:
-                    self._state['past_dist'], self._state['current_dist'] = self._state['current_dist'], torch.zeros((self.base_alphabet_size, 5), dtype=torch.float).to(self.device)
+            if self.log_lang_progress and (supplementary_info['index'] % 100 == 0):
+                current_dist, past_dist = self._state['current_dist'], self._state['past_dist']
+                if past_dist is None:
+                    self._state['past_dist'], self._state['current_dist'] = current_dist, torch.zeros_like(current_dist) # The second buffer is allocated here, once; from now on the two are swapped
                 else:
                     logit_c = (current_dist.view(1, -1) / current_dist.sum()).log()
                     prev_p = (past_dist.view(1, -1) / past_dist.sum())
                     kl = F.kl_div(logit_c, prev_p, reduction='batchmean').item()
                     self._write('llp/kl_div', kl, number_ex_seen, direct=True)
-                    self._state['past_dist'], self._state['current_dist'] = self._state['current_dist'], torch.zeros((self.base_alphabet_size, 5), dtype=torch.float).to(self.device)
+                    self._state['past_dist'], self._state['current_dist'] = current_dist, past_dist.zero_() # Double buffering: the old past distribution is zeroed in place and becomes the new accumulation buffer
 
             if self.log_debug:
-                self.log_grads_tensorboard(list(supplementary_info['parameters']))
+                self.log_grads_tensorboard(supplementary_info['parameters']) # Already a list, cached by the caller once per epoch
 
-        self._pbar.update(S=self._state['running_avg_success'])
+        self._pbar.update(S=self._state['running_avg_success']) # Refreshed at each synchronisation point; in between, the last synced value is displayed
 
         return {'running_avg_success': self._state['running_avg_success']}
 
@@ -270,16 +286,16 @@ class AutoLogger(object):
             `parameter_list`, the model parameters
             `event_writer`, the tensorboard summary
         """
-        raw_grad = torch.cat([p.grad.view(-1).detach() for p in parameters])
-        median_grad = raw_grad.abs().median().item()
-        mean_grad = raw_grad.abs().mean().item()
-        max_grad = raw_grad.abs().max().item()
-
-        norm_grad = torch.stack([p.grad.view(-1).detach().data.norm(2.) for p in parameters])
-        mean_norm_grad = norm_grad.mean().item()
-        max_norm_grad = norm_grad.max().item()
-        self._write('grad/median_grad', median_grad, number_ex_seen)
-        self._write('grad/mean_grad', mean_grad, number_ex_seen)
-        self._write('grad/max_grad', max_grad, number_ex_seen)
-        self._write('grad/mean_norm_grad', mean_norm_grad, number_ex_seen)
-        self._write('grad/max_norm_grad', max_norm_grad, number_ex_seen)
+        grads = [p.grad.detach() for p in parameter_list if(p.grad is not None)]
+        if(not grads): return
+
+        abs_grads = torch._foreach_abs(grads) # One fused kernel for all parameters
+        flat_grad = torch.cat([g.view(-1) for g in abs_grads]) # A single concatenation, reused by all the statistics below
+        norm_grad = torch.stack(torch._foreach_norm(grads, 2.0))
+
+        number_ex_seen = self._state['number_ex_seen']
+        self._write('grad/median_grad', flat_grad.median().item(), number_ex_seen)
+        self._write('grad/mean_grad', flat_grad.mean().item(), number_ex_seen)
+        self._write('grad/max_grad', flat_grad.max().item(), number_ex_seen)
+        self._write('grad/mean_norm_grad', norm_grad.mean().item(), number_ex_seen)
+        self._write('grad/max_norm_grad', norm_grad.max().item(), number_ex_seen)
@@ -1,19 +1,20 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.distributions.categorical import Categorical
 
 class MultiHeadsClassifier:
-    def __init__(self, image_encoder, optimizer, heads, n_heads, get_head_targets, device):
+    # `heads` is a single linear layer fusing all the heads: head i occupies the output rows [i * n_classes, (i + 1) * n_classes)
+    def __init__(self, image_encoder, optimizer, heads, n_heads, n_classes, get_head_targets, device):
         self.image_encoder = image_encoder
         self.optimizer = optimizer
         self.heads = heads
         self.n_heads = n_heads
+        self.n_classes = n_classes
         self.get_head_targets = get_head_targets
         self.device = device
 
     def run_batch(self, batch): # Only the target images will be used
-        self.optimizer.zero_grad()
+        self.optimizer.zero_grad(set_to_none=True)
 
         hits, losses = self.forward(batch)
 
@@ -30,15 +31,11 @@ class MultiHeadsClassifier:
         activation = self.image_encoder(batch_img)
         targets = batch.target_category(stack=True, f=self.get_head_targets).to(self.device)
 
-        losses = []
-        hits = []
-        for head, target in zip(self.heads, torch.unbind(targets, dim=1)):
-            pred = head(activation)
+        preds = F.log_softmax(self.heads(activation).view(-1, self.n_heads, self.n_classes), dim=-1) # A single GEMM and a single softmax for all heads
+        losses = F.nll_loss(preds.view(-1, self.n_classes), targets.reshape(-1), reduction='none').view(-1, self.n_heads)
+        hits = (preds.argmax(dim=-1) == targets).float()
 
-            losses.append(F.nll_loss(pred, target, reduction='none'))
-            hits.append((pred.argmax(dim=1) == target).float())
-
-        return hits, losses # Lists with one element per head
+        return torch.unbind(hits, dim=1), torch.unbind(losses, dim=1) # Sequences with one element per head
 
 # Message -> vector
 class MessageEncoder(nn.Module):
@@ -67,16 +64,16 @@ class MessageEncoder(nn.Module):
         # encode
         embeddings = self.symbol_embeddings(message)
         embeddings = self.lstm(embeddings)[0]
-        # select last step corresponding to message
-        index = torch.arange(message.size(-1)).expand_as(message).to(message.device)
-        output = embeddings.masked_select((index == (length-1)).unsqueeze(-1))
+        # select last step corresponding to message (a direct gather along the time dimension, instead of materialising a [batch x len x dim] boolean mask for masked_select)
+        index = (length - 1).long().view(-1, 1, 1).expand(-1, 1, embeddings.size(-1))
+        output = embeddings.gather(1, index).squeeze(1)
 
-        return output.view(embeddings.size(0), embeddings.size(-1))
+        return output
 
     @classmethod
     def from_args(cls, args, symbol_embeddings=None):
         if(symbol_embeddings is None): symbol_embeddings = build_embeddings(args.base_alphabet_size, args.hidden_size, use_bos=False)
-        return cls(args.base_alphabet_size, args.hidden_size, args.hidden_size, symbol_embeddings=symbol_embeddings)
+        return cls(args.base_alphabet_size, args.hidden_size, args.hidden_size, symbol_embeddings=symbol_embeddings) # Returned eager; the agent factories apply torch.jit.script, so module identities (e.g. the shared-embedding checks) remain inspectable here
 
 # Vector -> message
 class MessageDecoder(nn.Module):
@@ -91,76 +88,100 @@ class MessageDecoder(nn.Module):
 
         self.symbol_embeddings = symbol_embeddings
 
-        self.lstm = nn.LSTM(embedding_dim, output_dim, 1)
+        self.lstm_cell = nn.LSTMCell(embedding_dim, output_dim) # An explicit cell instead of a single-step nn.LSTM, which goes through the full (cuDNN) sequence wrapper at every timestep
         # project encoded img onto cell
         self.cell_proj = nn.Linear(embedding_dim, embedding_dim)
         # project encoded img onto hidden
         self.hidden_proj = nn.Linear(embedding_dim, embedding_dim)
-        # project lstm output onto action space
-        self.action_space_proj = nn.Linear(embedding_dim, base_alphabet_size + 1)
+        # The projection onto the action space reuses the symbol embeddings, transposed (weight tying, as in LM decoders): this halves the symbol-related parameters (and their optimizer state), only a bias is learnt separately
+        assert embedding_dim == output_dim, "weight tying requires the embedding and LSTM output dimensions to match"
+        self.output_bias = nn.Parameter(torch.zeros(base_alphabet_size + 1))
 
         self.max_msg_len = max_msg_len
         self.bos_index = base_alphabet_size + 2
         self.eos_index = 0
         self.padding_idx = base_alphabet_size + 1
 
+        # The BOS symbol only ever appears as the first input of the decoder, so its embedding is its own parameter (initialised from the corresponding embedding row); this saves one lookup kernel per forward
+        self.bos_embedding = nn.Parameter(symbol_embeddings.weight[self.bos_index].detach().clone())
+
     # Returns a dictionary.
     # encoded: tensor of shape (batch size, encoding size)
     def forward(self, encoded):
-        # Initialisation
-        last_symbol = torch.ones(encoded.size(0)).long().to(encoded.device) * self.bos_index
-        cell = self.cell_proj(encoded).unsqueeze(0)
-        hidden = self.hidden_proj(encoded).unsqueeze(0)
-        state = (cell, hidden)
+        batch_size = encoded.size(0)
+        device = encoded.device
 
-        # outputs
-        message = []
-        log_probs = []
-        entropy = []
-
-        # Used in the stopping mechanism (when EOS has been produced)
-        has_stopped = torch.zeros(encoded.size(0)).bool().to(encoded.device)
-        has_stopped.requires_grad = False
+        # Initialisation
+        last_embed = self.bos_embedding.unsqueeze(0).expand(batch_size, -1)
+        cell = self.cell_proj(encoded)
+        hidden = self.hidden_proj(encoded)
+
+        # outputs, preallocated and written in place step by step (a Python list plus torch.stack would copy every step's allocation once more at the end)
+        message = torch.full((batch_size, self.max_msg_len), self.padding_idx, dtype=torch.long, device=device)
+        log_probs = torch.zeros((batch_size, self.max_msg_len), device=device)
+        entropy = torch.zeros((batch_size, self.max_msg_len), device=device)
+        last_step = self.max_msg_len # Number of steps actually produced (smaller if the loop exits early)
+
+        # Used in the stopping mechanism (when EOS has been produced); allocated directly with the right dtype and device (a float allocation followed by .bool().to(device) launches two extra kernels and a transfer)
+        has_stopped = torch.zeros(batch_size, dtype=torch.bool, device=device)
+        # Rows still being decoded. The recurrent state and inputs are compacted to these rows, so the per-step work shrinks as messages complete instead of running full-batch kernels whose results would be overwritten with padding anyway.
+        active_idx = torch.arange(batch_size, device=device)
+        pad_vec = torch.full((1,), self.padding_idx, dtype=torch.long, device=device) # Broadcast by torch.where against the per-step results
+        zero_vec = torch.zeros(1, device=device)
+        emb_weight = self.symbol_embeddings.weight # Bound once for the whole loop: the per-step lookups go through F.embedding directly (no nn.Embedding module dispatch per step), and the tied output projection reads the same matrix
 
         # Produces the messages
+        # The distribution quantities are computed inline (instead of through torch.distributions.Categorical, which TorchScript cannot compile).
         # TODO Je serais d'avis à ne pas utiliser de EOS. Si l'action EOS est choisie, le message serait terminé sans qu'aucun symbol ne soit ajouté (ou plus techniquement, on ajoute un padding symbol). En fait, ça revient plus ou moins à fusionner le EOS et le padding symbol. Cela permettrait d'éviter d'avoir un symbol spécial apparaissant souvent mais pas toujours dans les "vrais" messages, ce qui peut compliquer l'analyse.
         for i in range(self.max_msg_len):
-            output, state = self.lstm(self.symbol_embeddings(last_symbol).unsqueeze(0), state)
-            output = self.action_space_proj(output).squeeze(0)
-
-            # Selects actions
-            probs = F.softmax(output, dim=-1) # Shape: (batch size, (alphabet size + 1))
-            dist = Categorical(probs)
-            action = dist.sample() if(self.training) else probs.argmax(dim=-1) # Shape: (batch size)
-
-            # Ignores prediction for completed messages
-            ent = dist.entropy() * (~has_stopped).float()
-            log_p = dist.log_prob(action) * (~has_stopped).float()
-            log_probs.append(log_p)
-            entropy.append(ent)
-
-            action = action.masked_fill(has_stopped, self.padding_idx)
-            message.append(action)
-
-            # Stops if all messages are complete
-            has_stopped = has_stopped | (action == self.eos_index)
-            if has_stopped.all():
-                break
-
-            last_symbol = action
-
-        # Converts output to tensor
-        message = torch.stack(message, dim=1) # Shape: (batch size, max msg length)
-        message_len = (message != self.padding_idx).sum(dim=1)[:, None] # Shape: (batch size, 1)
-        log_probs = torch.stack(log_probs, dim=1) # Shape: (batch size, max msg length)
-
-        # Average entropy over timesteps, hence ignore padding
-        entropy = torch.stack(entropy, dim=1) # Shape: (batch size, max msg length)
-        entropy = entropy.sum(dim=1, keepdim=True) # Shape: (batch size, 1)
-        entropy = entropy / message_len.float() # The average symbol distribution entropy over the message. Shape: (batch size, 1)
+            hidden, cell = self.lstm_cell(last_embed, (hidden, cell))
+            output = F.linear(hidden, emb_weight[:self.padding_idx], self.output_bias) # The action space (EOS and the base alphabet) corresponds to the first (base alphabet size + 1) embedding rows
+
+            # Selects actions. A single log_softmax pass provides the sample (through Gumbel-argmax, equivalent to categorical sampling), its log-probability and the entropy, instead of separate softmax/multinomial/log kernels.
+            log_p_all = F.log_softmax(output, dim=-1) # Shape: (active rows, (alphabet size + 1))
+            if(self.training):
+                gumbel = -torch.empty_like(log_p_all).exponential_().log()
+                action = (log_p_all + gumbel).argmax(-1) # Shape: (active rows)
+            else:
+                action = log_p_all.argmax(-1)
+
+            # Ignores prediction for completed messages (rows may stop between two compactions of `active_idx`): three torch.where selects against preallocated constants, pointwise ops the backend can fuse, instead of mask casting and multiplications
+            stopped = has_stopped[active_idx]
+            ent = torch.where(stopped, zero_vec, -(log_p_all.exp() * log_p_all).sum(-1))
+            log_p = torch.where(stopped, zero_vec, log_p_all.gather(-1, action.unsqueeze(-1)).squeeze(-1))
+            action = torch.where(stopped, pad_vec, action)
+
+            # Scatters the compacted step results into the preallocated outputs (completed rows keep their zero/padding values)
+            log_probs[active_idx, i] = log_p
+            entropy[active_idx, i] = ent
+            message[active_idx, i] = action
+
+            has_stopped[active_idx] = (stopped | (action == self.eos_index))
+            last_embed = F.embedding(action, emb_weight, padding_idx=self.padding_idx)
+
+            # Polls for termination (and compacts the working batch) every fourth step only: both the .all() check and the nonzero are device-to-host synchronisations, and issuing them every step serialises the GPU on a loop this short
+            if((i & 3) == 3):
+                # Stops if all messages are complete
+                if(bool(has_stopped.all())):
+                    last_step = (i + 1)
+                    break
+
+                # Drops the completed rows from the working batch
+                keep = torch.nonzero(~has_stopped[active_idx]).squeeze(-1)
+                if(keep.size(0) < active_idx.size(0)):
+                    active_idx = active_idx[keep]
+                    hidden, cell, last_embed = hidden[keep], cell[keep], last_embed[keep]
+
+        # Trims the timesteps that were never produced, if the loop exited early
+        message = message[:, :last_step] # Shape: (batch size, nb steps)
+        log_probs = log_probs[:, :last_step] # Shape: (batch size, nb steps)
+        message_len = (message != self.padding_idx).sum(dim=1, keepdim=True) # Shape: (batch size, 1)
+
+        # Average entropy over timesteps, hence ignore padding (the never-written entries are zero and do not contribute)
+        avg_entropy = (entropy.sum(dim=1, keepdim=True) / message_len.float()) # The average symbol distribution entropy over the message. Shape: (batch size, 1)
 
         outputs = {
-            "entropy": entropy,
+            "entropy": avg_entropy,
             "log_probs": log_probs,
             "message": message,
             "message_len": message_len}
@@ -175,7 +196,7 @@ class MessageDecoder(nn.Module):
             embedding_dim=args.hidden_size,
             output_dim=args.hidden_size,
             max_msg_len=args.max_len,
-            symbol_embeddings=symbol_embeddings,)
+            symbol_embeddings=symbol_embeddings,) # Returned eager; the agent factories apply torch.jit.script, so module identities (e.g. the shared-embedding checks) remain inspectable here
 
 # Adds noise to vectors.
 class NoiseAdder(nn.Module):
@@ -435,6 +456,42 @@ def _dcgan_cnn(hidden_size, track_running_stats=True):
 #     cnn = nn.Sequential(*layers)
 #     return cnn
 
+# Dynamic int8 quantization for CPU inference: the recurrent modules (the bulk of message encoding/decoding compute) and the linear projections get their weights stored in int8 and their matmuls run in the quantized kernels, typically 2-4x faster and half the memory on CPU. Returns a converted copy; it is for inference only (the quantized modules cannot be trained).
+# model: torch.nn.Module (e.g. a fresh MessageEncoder or MessageDecoder — eager, i.e. before any torch.jit.script wrapping)
+# output: torch.nn.Module
+# Raises:
+#     `TypeError` if the model is (or contains) a TorchScript module: dynamic quantization only swaps eager nn.Module instances and silently leaves scripted ones untouched, so accepting them would return a no-op copy
+#     `RuntimeError` if no module was actually converted (e.g. a model with none of the targeted layer types)
+def quantize_for_inference(model):
+    if(any(isinstance(module, torch.jit.ScriptModule) for module in model.modules())):
+        raise TypeError("quantize_for_inference expects eager modules; quantize before torch.jit.script (e.g. on a fresh MessageEncoder/MessageDecoder.from_args result), then script the quantized model if needed.")
+
+    quantized = torch.quantization.quantize_dynamic(model, {nn.LSTM, nn.LSTMCell, nn.Linear}, dtype=torch.qint8)
+
+    if(not any(type(module).__module__.startswith(('torch.ao.nn.quantized', 'torch.nn.quantized')) for module in quantized.modules())):
+        raise RuntimeError("dynamic quantization did not convert any module; the model contains no LSTM/LSTMCell/Linear to quantize.")
+
+    return quantized
+
+# Folds each batch-normalisation layer into the convolution that precedes it, for inference only (the fused modules no longer track batch statistics and must not be trained).
+# The factories below already emit flat Sequentials with the convolution directly followed by its BatchNorm2d (and in-place activations), so adjacent pairs line up for fusion; this removes one kernel launch and the BN parameter reads per block.
+# cnn: torch.nn.Sequential, as built by the factories below
+# output: the same torch.nn.Sequential, modified in place
+def fuse_conv_bn_for_inference(cnn):
+    from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+    cnn.eval() # Fusion bakes in the running statistics, which only the eval path uses
+    for i in range(len(cnn) - 1):
+        if(not isinstance(cnn[i + 1], nn.BatchNorm2d)): continue
+        if(isinstance(cnn[i], nn.Conv2d)):
+            cnn[i] = fuse_conv_bn_eval(cnn[i], cnn[i + 1])
+            cnn[i + 1] = nn.Identity()
+        elif(isinstance(cnn[i], nn.ConvTranspose2d)):
+            cnn[i] = fuse_conv_bn_eval(cnn[i], cnn[i + 1], transpose=True)
+            cnn[i + 1] = nn.Identity()
+
+    return cnn
+
 # output: torch.nn.Module
 def build_cnn_encoder_from_args(args):
     """
@@ -449,7 +506,10 @@ def build_cnn_encoder_from_args(args):
     else:
         if(not args.quiet): print("Using modern convolution architecture")
         short_cut = _dcgan_cnn(features, track_running_stats=track_running_stats)
-    
+
+    # Channels-last weights let cuDNN pick its fastest (tensor-core friendly) conv kernels, notably under the bfloat16 autocast enabled by --use_amp; inputs are converted on the fly by the conv itself
+    short_cut = short_cut.to(memory_format=torch.channels_last)
+
     return short_cut
     #
     # # for legacy or now
@@ -1,4 +1,5 @@
 import argparse
+import functools
 import os
 import pathlib
 import pprint
@@ -10,13 +11,13 @@ import socket # for `gethostname`
 import torch # for device
 from datetime import datetime
 
+@functools.lru_cache(maxsize=1) # The command line is parsed (and printed) only once per process, whichever entry point asks for it first
 def get_args():
     # TODO: given the number of args, i'd be in favor of a config file (e.g., configargparse)
     arg_parser = argparse.ArgumentParser()
 
     default_data_set = pathlib.Path('data') / 'concon'
     default_models = pathlib.Path('[summary]') / 'models'
-    default_summary = pathlib.Path('runs') / 'cbc' / ('[now]_' + socket.gethostname())
 
     group = arg_parser.add_argument_group(title='Data', description='arguments relative to data handling')
     group.add_argument('--data_set', help='the path to the data set', default=default_data_set, type=pathlib.Path)
@@ -30,7 +31,7 @@ def get_args():
     group.add_argument('--evaluation_categories', help='determines whether and which categories are kept for evaluation only', default=5, type=int)
 
     group = arg_parser.add_argument_group(title='Save', description='arguments relative to saving models/logs')
-    group.add_argument('--summary', help='the path to the TensorBoard summary for this run (\'[now]\' will be intepreted as now in the Y-m-d_H-M-S format)', default=default_summary, type=pathlib.Path)
+    group.add_argument('--summary', help='the path to the TensorBoard summary for this run (\'[now]\' will be intepreted as now in the Y-m-d_H-M-S format; defaults to runs/cbc/[now]_<hostname>)', default=None, type=pathlib.Path)
     group.add_argument('--save_every', '-save_every', help='indicate to save the model after each __ epochs', type=int, default=0)
     group.add_argument('--models', help='the path to the saved models (\'[summary]\' will be interpreted as the value of --summary)', default=default_models, type=pathlib.Path)
     group.add_argument('--dump_message', help='whether to regularly save the messages in a file', action="store_true")
@@ -68,6 +69,9 @@ def get_args():
     # device_choices = ['cpu', 'cuda', 'mkldnn', 'opengl', 'opencl', 'ideep', 'hip', 'msnpu']
     # group.add_argument('--device', help='what to run PyTorch on (potentially available: ' + ', '.join(device_choices) + ')', choices=device_choices, default='cpu')
     group.add_argument('--device', help='what to run PyTorch on', type=torch.device, default=torch.device('cpu'))
+    group.add_argument('--torch_compile', help='optimize the agents (and the pretraining models) with torch.compile', action='store_true')
+    group.add_argument('--use_amp', help='run the forward passes in bfloat16 mixed precision (autocast)', action='store_true')
+    group.add_argument('--distributed', help='data-parallel training across processes/GPUs (launch with torchrun)', action='store_true')
 
     group = arg_parser.add_argument_group(title='Architecture', description='arguments relative to model & game architecture')
     group.add_argument('--shared', '-s', help='share the image encoder and the symbol embeddings among each couple of Alice·s and Bob·s', action='store_true')
@@ -128,6 +132,8 @@ def get_args():
 
 
     args = arg_parser.parse_args()
+    if(args.summary is None): # Resolved after parsing, so that the hostname lookup only takes place when the default is actually used
+        args.summary = pathlib.Path('runs') / 'cbc' / ('[now]_' + socket.gethostname())
     if not args.quiet:
         print("command-line arguments:")
         pprint.pprint(vars(args), indent=4)